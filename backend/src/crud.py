@@ -1,27 +1,742 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import and_, delete, exists, func, or_, true, update
+from sqlalchemy.orm import selectinload
 from sqlmodel import Session, select
 
-from src.models import File
+from src.models import (
+    AudioChannel,
+    CatalogRevision,
+    File,
+    FileTombstone,
+    SubtitleChannel,
+    TranscodeJob,
+)
+from src.schemas import (
+    AudioChannelRead,
+    CandidateOrder,
+    CatalogStats,
+    DuplicateGroup,
+    FileDeleteFilter,
+    FileRead,
+    IngestStatus,
+    JobStatus,
+    SubtitleChannelRead,
+)
+
+# Load channels in one batched query per relationship instead of one per file
+CHANNEL_LOADERS = [
+    selectinload(File.audio_channels),
+    selectinload(File.subtitle_channels),
+]
+
+# Columns of each table that make up FileRead, for the serialization fast path
+FILE_READ_COLUMNS = [
+    name
+    for name in FileRead.model_fields
+    if name not in ("audio_channels", "subtitle_channels")
+]
+CHANNEL_READ_COLUMNS = {
+    "audio_channels": list(AudioChannelRead.model_fields),
+    "subtitle_channels": list(SubtitleChannelRead.model_fields),
+}
+CHANNEL_TABLES = [
+    (AudioChannel.__table__, "audio_channels"),
+    (SubtitleChannel.__table__, "subtitle_channels"),
+]
+
+JOB_LOADERS = [
+    selectinload(TranscodeJob.file).selectinload(File.audio_channels),
+    selectinload(TranscodeJob.file).selectinload(File.subtitle_channels),
+]
+
+# Values per IN (...) list, to stay under SQLite's bound parameter limit
+SQLITE_CHUNK = 500
+
+# A job whose lease expired this many times is marked failed instead of retried
+MAX_JOB_ATTEMPTS = 3
+
+# Codecs Jellyfin can direct play; anything else is a transcode candidate
+COMPATIBLE_VIDEO_CODECS = ("h264",)
+COMPATIBLE_AUDIO_CODECS = ("aac", "flac")
+COMPATIBLE_SUBTITLE_CODECS = ("srt", "ass", "subrip")
+# Bitmap subtitles can't be converted to text, so those files are skipped
+UNSUPPORTED_SUBTITLE_CODECS = ("hdmv_pgs_subtitle",)
+
+# (bucket, minimum width) pairs, widest first; anything narrower is SD
+RESOLUTION_BUCKETS = (("4K", 3200), ("1440p", 2200), ("1080p", 1600), ("720p", 1100))
+
+# Rough size of an H.264 re-encode relative to the source, and how much slower
+# than H.264 the source is to decode, per source video codec
+VIDEO_CODEC_ESTIMATES = {
+    "mpeg2video": (0.5, 1.0),
+    "mpeg4": (0.75, 1.0),
+    "msmpeg4v3": (0.75, 1.0),
+    "vc1": (0.8, 1.0),
+    "wmv3": (0.8, 1.0),
+    "vp9": (1.3, 1.2),
+    "hevc": (1.4, 1.3),
+    "av1": (1.6, 1.5),
+}
+# Throughputs the cost estimate is based on: a libx264 encode of about 1080p24
+# at twice real time, and the copies in and out of the transcode directory
+ENCODE_PIXELS_PER_SECOND = 1920 * 1080 * 24 * 2
+STREAM_ENCODE_SPEED = 200
+IO_BYTES_PER_SECOND = 200 * 1024**2
+# Assumed when ffprobe couldn't tell us
+DEFAULT_BIT_RATE = 8_000_000
+DEFAULT_PIXELS = 1920 * 1080
+# Typical bit rate given up by re-encoding an AC-3/DTS track to AAC
+AUDIO_BIT_RATE_SAVED = 384_000
+# What making a file direct-playable is worth, counted as bytes saved
+PLAYABLE_CREDIT = 1024**3
+
+UPSERT_FIELDS = (
+    "filename",
+    "file_extension",
+    "file_size",
+    "file_mtime_ns",
+    "video_codec",
+    "video_resolution",
+    "duration",
+    "bit_rate",
+    "fingerprint",
+)
+
+
+def chunked(values: list) -> list[list]:
+    """Split `values` into lists short enough for one IN (...) condition"""
+    return [
+        values[start : start + SQLITE_CHUNK]
+        for start in range(0, len(values), SQLITE_CHUNK)
+    ]
 
 
-def create_file(session: Session, file: File):
-    session.add(file)
+def get_files_by_filepath(session: Session, filepaths: list[str]) -> dict:
+    files = {}
+    for chunk in chunked(filepaths):
+        statement = (
+            select(File).where(File.filepath.in_(chunk)).options(*CHANNEL_LOADERS)
+        )
+        files.update((file.filepath, file) for file in session.exec(statement))
+    return files
+
+
+def upsert_files(
+    session: Session, files: list[File], moved_from: Optional[dict] = None
+):
+    """Insert new files and update changed ones by filepath, in one transaction.
+
+    `moved_from` maps new filepaths to old ones; a new path with no row of its
+    own takes over the row of its old path, keeping its id and jobs.
+    Returns (file_id, status) pairs in the order of `files`.
+    """
+    existing = get_files_by_filepath(session, [file.filepath for file in files])
+    moves = {
+        new_path: old_path
+        for new_path, old_path in (moved_from or {}).items()
+        if new_path not in existing
+    }
+    moved_rows = get_files_by_filepath(session, list(moves.values()))
+
+    results = []
+    for file in files:
+        db_file = existing.get(file.filepath)
+        status = IngestStatus.updated
+        if db_file is None and moves.get(file.filepath) in moved_rows:
+            db_file = moved_rows.pop(moves[file.filepath])
+            db_file.filepath = file.filepath
+            existing[file.filepath] = db_file
+            status = IngestStatus.moved
+
+        if db_file is None:
+            session.add(file)
+            existing[file.filepath] = file
+            results.append((file, IngestStatus.inserted))
+        elif (
+            status == IngestStatus.updated
+            and db_file.file_size == file.file_size
+            and db_file.file_mtime_ns == file.file_mtime_ns
+        ):
+            results.append((db_file, IngestStatus.unchanged))
+        else:
+            for field in UPSERT_FIELDS:
+                setattr(db_file, field, getattr(file, field))
+            db_file.audio_channels = [
+                AudioChannel(name=audio.name, channel=audio.channel, codec=audio.codec)
+                for audio in file.audio_channels
+            ]
+            db_file.subtitle_channels = [
+                SubtitleChannel(
+                    name=subtitle.name, subtitle=subtitle.subtitle, codec=subtitle.codec
+                )
+                for subtitle in file.subtitle_channels
+            ]
+            results.append((db_file, status))
+
+    changed = [file for file, status in results if status != IngestStatus.unchanged]
+    if changed:
+        revision = next_revision(session)
+        for file in changed:
+            file.priority = transcode_priority(file)
+            file.revision = revision
+
+    session.flush()
+    ids = [(file.id, status) for file, status in results]
     session.commit()
-    session.refresh(file)
-    return file
+    return ids
+
+
+def next_revision(session: Session) -> int:
+    """Claim the next catalog revision for the changes of this transaction.
+
+    The counter row stays locked until the transaction ends, so changes are
+    committed in revision order.
+    """
+    return session.exec(
+        update(CatalogRevision)
+        .values(revision=CatalogRevision.revision + 1)
+        .returning(CatalogRevision.revision)
+    ).scalar_one()
+
+
+def record_deletions(session: Session, deleted: list[tuple[int, str]]):
+    """Leave tombstones for deleted (file_id, filepath) pairs"""
+    if not deleted:
+        return
+    revision = next_revision(session)
+    file_ids = [file_id for file_id, _ in deleted]
+    # Ids of deleted rows can be reused, so a file can be deleted twice
+    for chunk in chunked(file_ids):
+        session.exec(delete(FileTombstone).where(FileTombstone.file_id.in_(chunk)))
+    session.add_all(
+        FileTombstone(file_id=file_id, filepath=filepath, revision=revision)
+        for file_id, filepath in deleted
+    )
+
+
+def get_changes(
+    session: Session,
+    since: int = 0,
+    after_id: Optional[int] = None,
+    limit: int = 1000,
+    raw: bool = False,
+) -> dict:
+    """Files changed after revision `since`, continuing from `after_id` within it.
+
+    Pages are ordered by (revision, id), so a consumer continues from the last
+    file of a page. Since 0 means the whole catalog.
+    """
+    catalog = session.exec(select(CatalogRevision)).one()
+    statement = select(File).order_by(File.revision, File.id)
+    if after_id is not None:
+        statement = statement.where(
+            or_(
+                File.revision > since,
+                and_(File.revision == since, File.id > after_id),
+            )
+        )
+    elif since:
+        statement = statement.where(File.revision > since)
+    statement = statement.limit(limit)
+    if raw:
+        files = file_rows(session, statement)
+    else:
+        files = session.exec(statement.options(*CHANNEL_LOADERS)).all()
+
+    deleted = []
+    if since and after_id is None:
+        deleted = [
+            dict(row)
+            for row in session.exec(
+                select(
+                    FileTombstone.file_id,
+                    FileTombstone.filepath,
+                    FileTombstone.revision,
+                )
+                .where(FileTombstone.revision > since)
+                .order_by(FileTombstone.revision)
+            ).mappings()
+        ]
+    return {
+        "catalog_id": catalog.catalog_id,
+        "revision": catalog.revision,
+        "files": files,
+        "deleted": deleted,
+        "complete": len(files) < limit,
+    }
 
 
 def get_file(session: Session, file_id: int):
-    return session.get(File, file_id)
+    return session.get(File, file_id, options=CHANNEL_LOADERS)
+
+
+def get_files(
+    session: Session,
+    skip: int = 0,
+    limit: int = 10,
+    after_id: Optional[int] = None,
+    min_size: Optional[int] = None,
+    raw: bool = False,
+):
+    statement = select(File).order_by(File.id)
+    if after_id is not None:
+        statement = statement.where(File.id > after_id)
+    if min_size is not None:
+        statement = statement.where(File.file_size >= min_size)
+    statement = statement.offset(skip).limit(limit)
+    if raw:
+        return file_rows(session, statement)
+    return session.exec(statement.options(*CHANNEL_LOADERS)).all()
+
+
+def iter_files(
+    session: Session, min_size: Optional[int] = None, batch_size: int = 1000
+):
+    """Yield every file in id order, fetching `batch_size` rows at a time"""
+    statement = (
+        select(File)
+        .options(*CHANNEL_LOADERS)
+        .order_by(File.id)
+        .execution_options(yield_per=batch_size)
+    )
+    if min_size is not None:
+        statement = statement.where(File.file_size >= min_size)
+    yield from session.exec(statement)
+
+
+def iter_file_rows(
+    session: Session, min_size: Optional[int] = None, batch_size: int = 1000
+):
+    """Like iter_files, but yield batches of plain dicts (see file_rows)"""
+    after_id = None
+    while True:
+        rows = get_files(
+            session, limit=batch_size, after_id=after_id, min_size=min_size, raw=True
+        )
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1]["id"]
+
+
+def file_rows(session: Session, statement) -> list[dict]:
+    """The files selected by `statement` as FileRead-shaped dicts.
+
+    Columns are read straight from the result rows, and channels are fetched
+    with one query per table, so no ORM objects or Pydantic models are built.
+    """
+    columns = [File.__table__.c[name] for name in FILE_READ_COLUMNS]
+    rows = [
+        {**row._mapping, "audio_channels": [], "subtitle_channels": []}
+        for row in session.execute(statement.with_only_columns(*columns))
+    ]
+    files_by_id = {row["id"]: row for row in rows}
+    file_ids = list(files_by_id)
+
+    for table, key in CHANNEL_TABLES:
+        columns = [table.c[name] for name in CHANNEL_READ_COLUMNS[key]]
+        for chunk in chunked(file_ids):
+            channels = session.execute(
+                select(table.c.file_id, *columns)
+                .where(table.c.file_id.in_(chunk))
+                .order_by(table.c.id)
+            )
+            for file_id, *values in channels:
+                files_by_id[file_id][key].append(
+                    dict(zip(CHANNEL_READ_COLUMNS[key], values))
+                )
+    return rows
+
+
+def needs_transcode():
+    """SQL condition matching files that have to be transcoded"""
+    has_unsupported_subtitles = exists().where(
+        SubtitleChannel.file_id == File.id,
+        SubtitleChannel.codec.in_(UNSUPPORTED_SUBTITLE_CODECS),
+    )
+    has_incompatible_audio = exists().where(
+        AudioChannel.file_id == File.id,
+        AudioChannel.codec.not_in(COMPATIBLE_AUDIO_CODECS),
+    )
+    has_incompatible_subtitles = exists().where(
+        SubtitleChannel.file_id == File.id,
+        SubtitleChannel.codec.not_in(COMPATIBLE_SUBTITLE_CODECS),
+    )
+    return and_(
+        ~has_unsupported_subtitles,
+        or_(
+            File.video_codec.is_(None),
+            File.video_codec.not_in(COMPATIBLE_VIDEO_CODECS),
+            has_incompatible_audio,
+            has_incompatible_subtitles,
+        ),
+    )
+
+
+def transcode_priority(file: File) -> float:
+    """Estimated benefit of transcoding `file`, in GiB saved per hour of work.
+
+    The benefit is the estimated size saving plus a fixed credit for making
+    the file direct-playable; re-encoding efficient codecs like HEVC to H.264
+    grows the file and eats into that credit. The cost is the encode time,
+    which scales with resolution, duration and source codec, plus the time to
+    copy the file. Files that only need their audio or subtitles converted
+    are cheap, so they rank well ahead of full video re-encodes.
+    """
+    duration = file.duration or file.file_size * 8 / (file.bit_rate or DEFAULT_BIT_RATE)
+    audio_encodes = sum(
+        audio.codec not in COMPATIBLE_AUDIO_CODECS for audio in file.audio_channels
+    )
+    subtitle_encodes = sum(
+        subtitle.codec not in COMPATIBLE_SUBTITLE_CODECS
+        for subtitle in file.subtitle_channels
+    )
+
+    saving = audio_encodes * duration * AUDIO_BIT_RATE_SAVED / 8
+    seconds = file.file_size / IO_BYTES_PER_SECOND
+    if file.video_codec not in COMPATIBLE_VIDEO_CODECS:
+        size_ratio, decode_factor = VIDEO_CODEC_ESTIMATES.get(
+            file.video_codec, (1.0, 1.0)
+        )
+        try:
+            width, height = map(int, file.video_resolution.split("x"))
+            pixels = width * height
+        except (AttributeError, ValueError):
+            pixels = DEFAULT_PIXELS
+        saving += file.file_size * (1 - size_ratio)
+        seconds += pixels * 24 * duration * decode_factor / ENCODE_PIXELS_PER_SECOND
+    elif audio_encodes or subtitle_encodes:
+        seconds += duration / STREAM_ENCODE_SPEED
+    else:
+        return 0
+
+    benefit = max(PLAYABLE_CREDIT + saving, 0) / 1024**3
+    return benefit / max(seconds / 3600, 1 / 3600)
+
+
+# Candidate orderings other than by id, all descending with id as a tiebreaker
+CANDIDATE_ORDER_COLUMNS = {
+    CandidateOrder.size: File.file_size,
+    CandidateOrder.priority: File.priority,
+}
 
 
-def get_files(session: Session, skip: int = 0, limit: int = 10):
-    return session.exec(select(File).offset(skip).limit(limit)).all()
+def order_candidates(
+    statement,
+    order_by: CandidateOrder = CandidateOrder.priority,
+    after_id: Optional[int] = None,
+    after_value: Optional[float] = None,
+):
+    """Apply a candidate ordering and its (after_value, after_id) keyset cursor"""
+    if order_by in CANDIDATE_ORDER_COLUMNS:
+        column = CANDIDATE_ORDER_COLUMNS[order_by]
+        statement = statement.order_by(column.desc(), File.id)
+        if after_id is not None and after_value is not None:
+            statement = statement.where(
+                or_(
+                    column < after_value,
+                    and_(column == after_value, File.id > after_id),
+                )
+            )
+        return statement
+
+    statement = statement.order_by(File.id)
+    if after_id is not None:
+        statement = statement.where(File.id > after_id)
+    return statement
+
+
+def get_candidates(
+    session: Session,
+    limit: int = 10,
+    order_by: CandidateOrder = CandidateOrder.priority,
+    after_id: Optional[int] = None,
+    after_value: Optional[float] = None,
+    raw: bool = False,
+):
+    statement = select(File).where(needs_transcode())
+    statement = order_candidates(statement, order_by, after_id, after_value)
+    statement = statement.limit(limit)
+    if raw:
+        return file_rows(session, statement)
+    return session.exec(statement.options(*CHANNEL_LOADERS)).all()
+
+
+def resolution_bucket(resolution: Optional[str]) -> str:
+    try:
+        width = int(resolution.split("x")[0])
+    except (AttributeError, ValueError):
+        return "unknown"
+    for name, min_width in RESOLUTION_BUCKETS:
+        if width >= min_width:
+            return name
+    return "SD"
+
+
+def get_catalog_totals(session: Session) -> tuple[int, int, int]:
+    """Number of files, their total size and the number of transcode candidates"""
+    total_files, total_size = session.exec(
+        select(func.count(File.id), func.coalesce(func.sum(File.file_size), 0))
+    ).one()
+    transcode_candidates = session.exec(
+        select(func.count(File.id)).where(needs_transcode())
+    ).one()
+    return total_files, total_size, transcode_candidates
+
+
+def get_stats(session: Session) -> CatalogStats:
+    """Catalog totals and histograms, aggregated by the database"""
+    total_files, total_size, max_file_size = session.exec(
+        select(func.count(File.id), func.sum(File.file_size), func.max(File.file_size))
+    ).one()
+    transcode_candidates = session.exec(
+        select(func.count(File.id)).where(needs_transcode())
+    ).one()
+
+    video_codecs = dict(
+        session.exec(
+            select(File.video_codec, func.count(File.id))
+            .where(File.video_codec.is_not(None))
+            .group_by(File.video_codec)
+        ).all()
+    )
+    audio_codecs = dict(
+        session.exec(
+            select(AudioChannel.codec, func.count(AudioChannel.id))
+            .join(File)
+            .group_by(AudioChannel.codec)
+        ).all()
+    )
+    subtitle_codecs = dict(
+        session.exec(
+            select(SubtitleChannel.codec, func.count(SubtitleChannel.id))
+            .join(File)
+            .group_by(SubtitleChannel.codec)
+        ).all()
+    )
+
+    # Only a handful of distinct resolutions exist, so bucketing them here is cheap
+    resolutions = {}
+    for resolution, count in session.exec(
+        select(File.video_resolution, func.count(File.id)).group_by(
+            File.video_resolution
+        )
+    ):
+        bucket = resolution_bucket(resolution)
+        resolutions[bucket] = resolutions.get(bucket, 0) + count
+
+    return CatalogStats(
+        total_files=total_files,
+        total_size=total_size or 0,
+        max_file_size=max_file_size,
+        transcode_candidates=transcode_candidates,
+        transcode_fraction=transcode_candidates / total_files if total_files else 0,
+        video_codecs=video_codecs,
+        audio_codecs=audio_codecs,
+        subtitle_codecs=subtitle_codecs,
+        resolutions=resolutions,
+    )
 
 
 def delete_file(session: Session, file_id: int):
     file = session.get(File, file_id)
     if file:
+        record_deletions(session, [(file.id, file.filepath)])
         session.delete(file)
         session.commit()
         return True
     return False
+
+
+def selected_file_ids(session: Session, file_filter: FileDeleteFilter) -> list[int]:
+    """Ids of the files listed by id and by path; with both, those in both lists"""
+    if not file_filter.filepaths:
+        return file_filter.ids
+
+    file_ids = []
+    for chunk in chunked(file_filter.filepaths):
+        file_ids += session.exec(select(File.id).where(File.filepath.in_(chunk))).all()
+    if file_filter.ids:
+        listed = frozenset(file_filter.ids)
+        file_ids = [file_id for file_id in file_ids if file_id in listed]
+    return file_ids
+
+
+def delete_files(session: Session, file_filter: FileDeleteFilter) -> int:
+    """Delete the files matching `file_filter` in one transaction; channels cascade"""
+    conditions = []
+    if file_filter.path_prefix:
+        conditions.append(
+            File.filepath.startswith(file_filter.path_prefix, autoescape=True)
+        )
+    if file_filter.video_codec is not None:
+        conditions.append(File.video_codec == file_filter.video_codec)
+
+    selections = [true()]
+    if file_filter.ids or file_filter.filepaths:
+        file_ids = selected_file_ids(session, file_filter)
+        selections = [File.id.in_(chunk) for chunk in chunked(file_ids)]
+
+    deleted = []
+    for selection in selections:
+        deleted += session.exec(
+            delete(File).where(selection, *conditions).returning(File.id, File.filepath)
+        ).all()
+    record_deletions(session, deleted)
+    session.commit()
+    return len(deleted)
+
+
+def get_duplicates(session: Session, limit: int = 100) -> list[DuplicateGroup]:
+    """Groups of files sharing a fingerprint, most reclaimable bytes first"""
+    groups = session.exec(
+        select(File.fingerprint, func.max(File.file_size), func.count(File.id))
+        .where(File.fingerprint.is_not(None))
+        .group_by(File.fingerprint)
+        .having(func.count(File.id) > 1)
+        .order_by((func.max(File.file_size) * (func.count(File.id) - 1)).desc())
+        .limit(limit)
+    ).all()
+
+    filepaths = {}
+    fingerprints = [fingerprint for fingerprint, _, _ in groups]
+    for chunk in chunked(fingerprints):
+        for fingerprint, filepath in session.exec(
+            select(File.fingerprint, File.filepath)
+            .where(File.fingerprint.in_(chunk))
+            .order_by(File.filepath)
+        ):
+            filepaths.setdefault(fingerprint, []).append(filepath)
+
+    return [
+        DuplicateGroup(
+            fingerprint=fingerprint,
+            file_size=file_size,
+            filepaths=filepaths[fingerprint],
+            reclaimable=file_size * (count - 1),
+        )
+        for fingerprint, file_size, count in groups
+    ]
+
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
+
+def enqueue_jobs(
+    session: Session,
+    limit: int = 10,
+    order_by: CandidateOrder = CandidateOrder.priority,
+):
+    """Queue jobs for the next candidates that don't already have an active job"""
+    has_active_job = exists().where(
+        TranscodeJob.file_id == File.id,
+        TranscodeJob.status.in_((JobStatus.queued, JobStatus.running)),
+    )
+    statement = select(File.id).where(needs_transcode(), ~has_active_job)
+    file_ids = session.exec(order_candidates(statement, order_by).limit(limit)).all()
+
+    now = utcnow()
+    jobs = [
+        TranscodeJob(file_id=file_id, created_at=now, updated_at=now)
+        for file_id in file_ids
+    ]
+    session.add_all(jobs)
+    session.flush()
+    ids = [job.id for job in jobs]
+    session.commit()
+    return get_jobs(session, ids=ids)
+
+
+def get_jobs(
+    session: Session,
+    status: Optional[JobStatus] = None,
+    ids: Optional[list[int]] = None,
+    limit: Optional[int] = None,
+):
+    statement = select(TranscodeJob).options(*JOB_LOADERS).order_by(TranscodeJob.id)
+    if status is not None:
+        statement = statement.where(TranscodeJob.status == status)
+    if ids is not None:
+        statement = statement.where(TranscodeJob.id.in_(ids))
+    return session.exec(statement.limit(limit)).all()
+
+
+def get_job(session: Session, job_id: int):
+    return session.get(TranscodeJob, job_id, options=JOB_LOADERS)
+
+
+def claim_job(session: Session, worker: str, lease_seconds: int):
+    """Atomically lease the oldest queued job, or one whose lease has expired.
+
+    The claim is a compare-and-set UPDATE guarded by the same condition used to
+    pick the job, so two workers racing for it can't both win.
+    """
+    now = utcnow()
+    expired = and_(
+        TranscodeJob.status == JobStatus.running, TranscodeJob.lease_expires_at < now
+    )
+
+    # Jobs whose workers keep dying are given up on rather than retried forever
+    session.exec(
+        update(TranscodeJob)
+        .where(expired, TranscodeJob.attempts >= MAX_JOB_ATTEMPTS)
+        .values(status=JobStatus.failed, error="Lease expired", updated_at=now)
+    )
+    session.commit()
+
+    claimable = or_(TranscodeJob.status == JobStatus.queued, expired)
+    while True:
+        job_id = session.exec(
+            select(TranscodeJob.id).where(claimable).order_by(TranscodeJob.id).limit(1)
+        ).first()
+        if job_id is None:
+            return None
+
+        result = session.exec(
+            update(TranscodeJob)
+            .where(TranscodeJob.id == job_id, claimable)
+            .values(
+                status=JobStatus.running,
+                worker=worker,
+                lease_expires_at=now + timedelta(seconds=lease_seconds),
+                attempts=TranscodeJob.attempts + 1,
+                updated_at=now,
+            )
+        )
+        session.commit()
+        if result.rowcount == 1:
+            return get_job(session, job_id)
+
+
+def update_leased_job(
+    session: Session,
+    job_id: int,
+    leaseholder: str,
+    require_unexpired: bool = False,
+    **values,
+):
+    """Update a running job, provided `leaseholder` still holds its lease.
+
+    With `require_unexpired` the lease must also not have run out, as for a
+    heartbeat. Results are still accepted from a worker whose lease expired
+    as long as no other worker claimed the job since, so a worker resuming
+    after a crash or retrying its report doesn't waste a finished encode.
+    """
+    now = utcnow()
+    conditions = [
+        TranscodeJob.id == job_id,
+        TranscodeJob.status == JobStatus.running,
+        TranscodeJob.worker == leaseholder,
+    ]
+    if require_unexpired:
+        conditions.append(TranscodeJob.lease_expires_at >= now)
+    result = session.exec(
+        update(TranscodeJob).where(*conditions).values(updated_at=now, **values)
+    )
+    session.commit()
+    if result.rowcount != 1:
+        return None
+    return get_job(session, job_id)
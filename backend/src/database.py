@@ -1,8 +1,15 @@
 import os
+import uuid
 
 from dotenv import load_dotenv
+from sqlalchemy import delete, event, func, insert, inspect, or_, select, text
+from sqlalchemy.schema import AddConstraint
 from sqlmodel import Session, SQLModel, create_engine
 
+from src.crud import CHANNEL_LOADERS, transcode_priority
+from src.metrics import instrument_engine
+from src.models import AudioChannel, CatalogRevision, File, SubtitleChannel
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -10,11 +17,149 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set")
 
-engine = create_engine(DATABASE_URL, echo=True)
+DATABASE_ECHO = os.getenv("DATABASE_ECHO", "false").lower() in ("1", "true", "yes")
+
+engine = create_engine(DATABASE_URL, echo=DATABASE_ECHO)
+instrument_engine(engine)
+
+# Applied to every SQLite connection. WAL lets UI reads run alongside scanner
+# writes, and synchronous=NORMAL is still crash safe in WAL mode.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    "busy_timeout": 5000,
+    "mmap_size": 256 * 1024 * 1024,
+    # Negative sizes are in KiB
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+}
+
+
+if engine.dialect.name == "sqlite":
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+        cursor.close()
 
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        migrate(connection)
+
+
+def migrate(connection):
+    """Bring tables created by older versions up to date with the models"""
+    inspector = inspect(connection)
+    added_columns = set()
+    for table in SQLModel.metadata.sorted_tables:
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                column_type = column.type.compile(dialect=connection.dialect)
+                # Existing rows need a default before the column can be NOT NULL
+                if column.server_default is not None:
+                    column_type += f" DEFAULT {column.server_default.arg}"
+                    if not column.nullable:
+                        column_type += " NOT NULL"
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                    )
+                )
+                added_columns.add(f"{table.name}.{column.name}")
+
+        foreign_keys = {
+            tuple(foreign_key["constrained_columns"]): foreign_key
+            for foreign_key in inspector.get_foreign_keys(table.name)
+        }
+        for constraint in table.foreign_key_constraints:
+            existing = foreign_keys.get(tuple(constraint.column_keys))
+            if (
+                existing
+                and (existing["options"].get("ondelete") or "").upper()
+                != (constraint.ondelete or "").upper()
+            ):
+                update_foreign_key(connection, table, constraint, existing)
+
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in indexes:
+                continue
+            if index.name == "ix_file_filepath":
+                remove_duplicate_files(connection)
+            index.create(connection)
+
+    if "file.priority" in added_columns:
+        update_priorities(connection)
+
+    # A new catalog id makes consumers of a replaced database start over
+    if connection.execute(select(CatalogRevision.id)).first() is None:
+        connection.execute(
+            insert(CatalogRevision).values(id=1, catalog_id=uuid.uuid4().hex)
+        )
+
+
+def update_foreign_key(connection, table, constraint, existing):
+    """Give an existing foreign key the ON DELETE action of the model"""
+    # Rows pointing at deleted files were left behind before deletes cascaded
+    if constraint.ondelete == "CASCADE":
+        connection.execute(
+            delete(table).where(
+                or_(
+                    constraint.columns[0].is_(None),
+                    constraint.columns[0].not_in(select(File.id)),
+                )
+            )
+        )
+
+    if connection.dialect.name != "sqlite":
+        connection.execute(
+            text(f"ALTER TABLE {table.name} DROP CONSTRAINT {existing['name']}")
+        )
+        connection.execute(AddConstraint(constraint))
+        return
+
+    # SQLite can't alter constraints, so copy the rows into a fresh table
+    old_name = f"_{table.name}_old"
+    connection.execute(text(f"ALTER TABLE {table.name} RENAME TO {old_name}"))
+    old_indexes = connection.execute(
+        text(
+            "SELECT name FROM sqlite_master "
+            "WHERE type = 'index' AND tbl_name = :table AND sql IS NOT NULL"
+        ),
+        {"table": old_name},
+    ).scalars()
+    for index_name in list(old_indexes):
+        connection.execute(text(f"DROP INDEX {index_name}"))
+    table.create(connection)
+    columns = ", ".join(
+        column["name"] for column in inspect(connection).get_columns(old_name)
+    )
+    connection.execute(
+        text(f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {old_name}")
+    )
+    connection.execute(text(f"DROP TABLE {old_name}"))
+
+
+def remove_duplicate_files(connection):
+    """Keep only the newest row per filepath, as rescans used to insert duplicates"""
+    newest = select(func.max(File.id)).group_by(File.filepath)
+    for channel in (AudioChannel, SubtitleChannel):
+        connection.execute(delete(channel).where(channel.file_id.not_in(newest)))
+    connection.execute(delete(File).where(File.id.not_in(newest)))
+
+
+def update_priorities(connection):
+    """Score files that were catalogued before priorities existed"""
+    with Session(bind=connection) as session:
+        for file in session.scalars(select(File).options(*CHANNEL_LOADERS)):
+            file.priority = transcode_priority(file)
+        session.flush()
 
 
 def get_session():
@@ -1,8 +1,16 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+# Brotli compresses catalog JSON better, and falls back to gzip for clients
+# that don't accept it
+try:
+    from brotli_asgi import BrotliMiddleware as CompressionMiddleware
+except ImportError:
+    from fastapi.middleware.gzip import GZipMiddleware as CompressionMiddleware
+
 from src.database import create_db_and_tables
-from src.routers import file_router
+from src.metrics import MetricsMiddleware
+from src.routers import file_router, job_router, metrics_router
 
 app = FastAPI()
 
@@ -13,6 +21,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Responses smaller than this go out uncompressed
+app.add_middleware(CompressionMiddleware, minimum_size=1024)
+# Outermost, so request timings include compression
+app.add_middleware(MetricsMiddleware)
 
 
 @app.on_event("startup")
@@ -21,6 +33,8 @@ def on_startup():
 
 
 app.include_router(file_router, prefix="/files", tags=["files"])
+app.include_router(job_router, prefix="/jobs", tags=["jobs"])
+app.include_router(metrics_router, tags=["metrics"])
 
 
 @app.get("/")
@@ -0,0 +1,247 @@
+"""Request, database and catalog metrics in the Prometheus text format.
+
+Metrics are kept in process memory and rendered on each scrape of /metrics.
+Recording a sample is a dict update under a lock, so instrumenting every
+request and query costs next to nothing.
+"""
+
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.lock = threading.Lock()
+        self.values = {}
+        REGISTRY.append(self)
+
+    def label_string(self, labels: tuple, extra: str = "") -> str:
+        pairs = [
+            f'{name}="{escape_label(value)}"'
+            for name, value in zip(self.labelnames, labels)
+        ]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{self.label_string(labels)} {format_value(value)}"
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines += self.samples()
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, *labels):
+        with self.lock:
+            self.values[labels] = value
+
+    def inc(self, *labels, amount: float = 1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self, name: str, help: str, labelnames: tuple = (), buckets=LATENCY_BUCKETS
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels):
+        with self.lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                # Per-bucket counts, then the sum and count of all observations
+                counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    def samples(self):
+        with self.lock:
+            values = {labels: list(counts) for labels, counts in self.values.items()}
+        for labels, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                extra = f'le="{format_value(bound)}"'
+                yield f"{self.name}_bucket{self.label_string(labels, extra)} {cumulative}"
+            infinity = self.label_string(labels, 'le="+Inf"')
+            yield f"{self.name}_bucket{infinity} {counts[-1]}"
+            yield f"{self.name}_sum{self.label_string(labels)} {format_value(counts[-2])}"
+            yield f"{self.name}_count{self.label_string(labels)} {counts[-1]}"
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+REGISTRY: list[Metric] = []
+
+REQUESTS = Counter(
+    "jellyfier_http_requests_total",
+    "HTTP requests handled, by route and status code",
+    ("method", "route", "status"),
+)
+REQUEST_DURATION = Histogram(
+    "jellyfier_http_request_duration_seconds",
+    "Time to handle an HTTP request, including sending the body",
+    ("method", "route"),
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "jellyfier_http_requests_in_progress", "HTTP requests being handled"
+)
+REQUEST_QUERIES = Histogram(
+    "jellyfier_http_request_db_queries",
+    "Database queries run while handling an HTTP request",
+    ("method", "route"),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+REQUEST_QUERY_DURATION = Histogram(
+    "jellyfier_http_request_db_seconds",
+    "Time spent in database queries while handling an HTTP request",
+    ("method", "route"),
+)
+QUERIES = Counter("jellyfier_db_queries_total", "Database queries run")
+QUERY_DURATION = Counter(
+    "jellyfier_db_query_seconds_total", "Time spent in database queries"
+)
+FILES_INGESTED = Counter(
+    "jellyfier_files_ingested_total",
+    "Files sent by scanners, by outcome",
+    ("status",),
+)
+CATALOG_FILES = Gauge("jellyfier_catalog_files", "Files in the catalog")
+CATALOG_BYTES = Gauge("jellyfier_catalog_bytes", "Total size of the catalogued files")
+TRANSCODE_CANDIDATES = Gauge(
+    "jellyfier_transcode_candidates", "Catalogued files that need transcoding"
+)
+
+
+def render_metrics() -> str:
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+@dataclass
+class RequestQueries:
+    count: int = 0
+    seconds: float = 0.0
+
+
+# Queries of the request being handled; threadpool workers run with a copy
+# of the request's context, so they add to the same object
+current_queries: ContextVar[Optional[RequestQueries]] = ContextVar(
+    "current_queries", default=None
+)
+
+
+def instrument_engine(engine):
+    """Count and time every query `engine` runs"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query(connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_query(connection, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - connection.info["query_start"].pop()
+        QUERIES.inc()
+        QUERY_DURATION.inc(amount=seconds)
+        queries = current_queries.get()
+        if queries is not None:
+            queries.count += 1
+            queries.seconds += seconds
+
+
+def route_template(scope) -> str:
+    """Path template of the route that handled a request, like /files/{file_id}.
+
+    Labelling by template keeps ids in paths from each starting a new series.
+    Routes of included routers may only know their path below the router's
+    prefix, so the prefix is taken from the request path.
+    """
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    path = scope["path"]
+    for index, char in enumerate(path):
+        if char == "/" and route.path_regex.match(path[index:]):
+            return path[:index] + route.path
+    return route.path
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing requests and the database queries they run"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        queries = RequestQueries()
+        token = current_queries.set(queries)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            seconds = time.perf_counter() - start
+            REQUESTS_IN_PROGRESS.inc(amount=-1)
+            current_queries.reset(token)
+
+            route = route_template(scope)
+            method = scope["method"]
+            REQUESTS.inc(method, route, str(status))
+            REQUEST_DURATION.observe(seconds, method, route)
+            REQUEST_QUERIES.observe(queries.count, method, route)
+            REQUEST_QUERY_DURATION.observe(queries.seconds, method, route)
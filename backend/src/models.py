@@ -1,33 +1,101 @@
+from datetime import datetime
 from typing import List, Optional
 
+from sqlalchemy import Index
 from sqlmodel import Field, Relationship, SQLModel
 
 
 class AudioChannel(SQLModel, table=True):
+    # Finds a file's channels, optionally by codec. Without it the candidate
+    # query would use the codec index and scan every channel with that codec.
+    __table_args__ = (Index("ix_audiochannel_file_id_codec", "file_id", "codec"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    file_id: Optional[int] = Field(default=None, foreign_key="file.id")
+    file_id: Optional[int] = Field(
+        default=None, foreign_key="file.id", ondelete="CASCADE"
+    )
     name: str  # Add this line
     channel: str
-    codec: str
+    codec: str = Field(index=True)
     file: Optional["File"] = Relationship(back_populates="audio_channels")
 
 
 class SubtitleChannel(SQLModel, table=True):
+    # See AudioChannel
+    __table_args__ = (Index("ix_subtitlechannel_file_id_codec", "file_id", "codec"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    file_id: Optional[int] = Field(default=None, foreign_key="file.id")
+    file_id: Optional[int] = Field(
+        default=None, foreign_key="file.id", ondelete="CASCADE"
+    )
     name: str  # Add this line
     subtitle: str
-    codec: str
+    codec: str = Field(index=True)
     file: Optional["File"] = Relationship(back_populates="subtitle_channels")
 
 
 class File(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    filepath: str
+    filepath: str = Field(index=True, unique=True)
     filename: str
     file_extension: str
-    file_size: int
-    video_codec: Optional[str] = None
+    file_size: int = Field(index=True)
+    file_mtime_ns: Optional[int] = None
+    video_codec: Optional[str] = Field(default=None, index=True)
     video_resolution: Optional[str] = None
-    audio_channels: List[AudioChannel] = Relationship(back_populates="file")
-    subtitle_channels: List[SubtitleChannel] = Relationship(back_populates="file")
+    duration: Optional[float] = None
+    bit_rate: Optional[int] = None
+    # Size plus a hash of a few blocks of content, shared by copies of a file
+    fingerprint: Optional[str] = Field(default=None, index=True)
+    # Worth of transcoding the file, kept up to date on ingest (see crud.transcode_priority)
+    priority: float = Field(
+        default=0, index=True, sa_column_kwargs={"server_default": "0"}
+    )
+    # Catalog revision of the last change to the file, for syncing consumers
+    revision: int = Field(
+        default=0, index=True, sa_column_kwargs={"server_default": "0"}
+    )
+    # Channels keep ffprobe's stream order, which transcode plans index into
+    audio_channels: List[AudioChannel] = Relationship(
+        back_populates="file",
+        cascade_delete=True,
+        passive_deletes=True,
+        sa_relationship_kwargs={"order_by": "AudioChannel.id"},
+    )
+    subtitle_channels: List[SubtitleChannel] = Relationship(
+        back_populates="file",
+        cascade_delete=True,
+        passive_deletes=True,
+        sa_relationship_kwargs={"order_by": "SubtitleChannel.id"},
+    )
+
+
+class FileTombstone(SQLModel, table=True):
+    # Deleted files, so syncing consumers learn about deletions too
+    file_id: int = Field(primary_key=True)
+    filepath: str
+    revision: int = Field(index=True)
+
+
+class CatalogRevision(SQLModel, table=True):
+    # A single row counting changes to the catalog. The catalog id tells
+    # consumers when the database was replaced and their revision is void.
+    id: Optional[int] = Field(default=None, primary_key=True)
+    catalog_id: str
+    revision: int = 0
+
+
+class TranscodeJob(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    # Jobs outlive the catalog entry, which is removed once a file is processed
+    file_id: Optional[int] = Field(
+        default=None, foreign_key="file.id", ondelete="SET NULL", index=True
+    )
+    status: str = Field(default="queued", index=True)
+    worker: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    file: Optional[File] = Relationship()
@@ -1,23 +1,94 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from datetime import timedelta
+from typing import Any, Optional
+
+from fastapi import APIRouter, Body, Depends, HTTPException
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import ValidationError
 from sqlmodel import Session
 
-from src.crud import create_file, delete_file, get_file, get_files
-from src.database import get_session
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from src.crud import (
+    COMPATIBLE_AUDIO_CODECS,
+    COMPATIBLE_SUBTITLE_CODECS,
+    COMPATIBLE_VIDEO_CODECS,
+    claim_job,
+    delete_file,
+    delete_files,
+    enqueue_jobs,
+    get_candidates,
+    get_catalog_totals,
+    get_changes,
+    get_duplicates,
+    get_file,
+    get_files,
+    get_jobs,
+    get_stats,
+    iter_file_rows,
+    iter_files,
+    update_leased_job,
+    upsert_files,
+    utcnow,
+)
+from src.database import engine, get_session
+from src.metrics import (
+    CATALOG_BYTES,
+    CATALOG_FILES,
+    FILES_INGESTED,
+    TRANSCODE_CANDIDATES,
+    render_metrics,
+)
 from src.models import AudioChannel, File, SubtitleChannel
-from src.schemas import FileCreate, FileRead
+from src.schemas import (
+    CandidateOrder,
+    CatalogStats,
+    CompatibleCodecs,
+    DuplicateGroup,
+    FileChanges,
+    FileCreate,
+    FileDeleteFilter,
+    FileIngestResult,
+    FileRead,
+    FilesDeleted,
+    FileUpsertRead,
+    IngestStatus,
+    JobLease,
+    JobRead,
+    JobReport,
+    JobStatus,
+)
 
 file_router = APIRouter()
 
 
-@file_router.post("/", response_model=FileRead)
-def create_new_file(file: FileCreate, session: Session = Depends(get_session)):
-    db_file = File(
+def dump_json(content) -> bytes:
+    """Serialize plain data with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(",", ":")).encode()
+
+
+def fast_json_response(content) -> Response:
+    """Skip response_model validation for rows already shaped like the model"""
+    return Response(dump_json(content), media_type="application/json")
+
+
+def build_db_file(file: FileCreate) -> File:
+    return File(
         filepath=file.filepath,
         filename=file.filename,
         file_extension=file.file_extension,
         file_size=file.file_size,
+        file_mtime_ns=file.file_mtime_ns,
         video_codec=file.video_codec,
         video_resolution=file.video_resolution,
+        duration=file.duration,
+        bit_rate=file.bit_rate,
+        fingerprint=file.fingerprint,
         audio_channels=[
             AudioChannel(name=audio.name, channel=audio.channel, codec=audio.codec)
             for audio in file.audio_channels
@@ -33,7 +104,133 @@ def create_new_file(file: FileCreate, session: Session = Depends(get_session)):
         if file.subtitle_channels
         else [],
     )
-    return create_file(session, db_file)
+
+
+def moved_from_paths(files: list[FileCreate]) -> dict:
+    return {file.filepath: file.moved_from for file in files if file.moved_from}
+
+
+@file_router.post("/", response_model=FileUpsertRead)
+def create_new_file(file: FileCreate, session: Session = Depends(get_session)):
+    [(file_id, status)] = upsert_files(
+        session, [build_db_file(file)], moved_from=moved_from_paths([file])
+    )
+    FILES_INGESTED.inc(status.value)
+    return FileUpsertRead.model_validate(
+        get_file(session, file_id), update={"status": status}
+    )
+
+
+def validation_message(error: ValidationError) -> str:
+    messages = []
+    for detail in error.errors(include_url=False):
+        location = ".".join(str(part) for part in detail["loc"])
+        messages.append(f"{location}: {detail['msg']}" if location else detail["msg"])
+    return "; ".join(messages)
+
+
+@file_router.post("/bulk", response_model=list[FileIngestResult])
+def create_new_files(
+    items: list[Any] = Body(), session: Session = Depends(get_session)
+):
+    """Ingest a batch of files; invalid items are reported without failing the rest"""
+    ingest_results = [None] * len(items)
+    files = {}
+    for index, item in enumerate(items):
+        try:
+            files[index] = FileCreate.model_validate(item)
+        except ValidationError as e:
+            FILES_INGESTED.inc(IngestStatus.invalid.value)
+            filepath = item.get("filepath") if isinstance(item, dict) else None
+            ingest_results[index] = FileIngestResult(
+                filepath=filepath if isinstance(filepath, str) else None,
+                status=IngestStatus.invalid,
+                error=validation_message(e),
+            )
+
+    results = upsert_files(
+        session,
+        [build_db_file(file) for file in files.values()],
+        moved_from=moved_from_paths(list(files.values())),
+    )
+    for (file_id, status), (index, file) in zip(results, files.items()):
+        FILES_INGESTED.inc(status.value)
+        ingest_results[index] = FileIngestResult(
+            id=file_id, filepath=file.filepath, status=status
+        )
+    return ingest_results
+
+
+@file_router.get("/stream")
+def stream_files(min_size: Optional[int] = None, fast: bool = False):
+    """Stream the whole catalog as NDJSON, one FileRead per line"""
+
+    def generate():
+        # The request-scoped session is closed before the body is sent
+        with Session(engine) as session:
+            if fast:
+                for rows in iter_file_rows(session, min_size=min_size):
+                    yield b"".join(dump_json(row) + b"\n" for row in rows)
+                return
+            for file in iter_files(session, min_size=min_size):
+                yield FileRead.model_validate(file).model_dump_json() + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@file_router.get("/stats", response_model=CatalogStats)
+def read_stats(session: Session = Depends(get_session)):
+    return get_stats(session)
+
+
+@file_router.get("/duplicates", response_model=list[DuplicateGroup])
+def read_duplicates(limit: int = 100, session: Session = Depends(get_session)):
+    return get_duplicates(session, limit=limit)
+
+
+@file_router.get("/codecs", response_model=CompatibleCodecs)
+def read_compatible_codecs():
+    """Codecs the candidates are judged by, so transcoders copy the same streams"""
+    return CompatibleCodecs(
+        video=list(COMPATIBLE_VIDEO_CODECS),
+        audio=list(COMPATIBLE_AUDIO_CODECS),
+        subtitle=list(COMPATIBLE_SUBTITLE_CODECS),
+    )
+
+
+@file_router.get("/candidates", response_model=list[FileRead])
+def read_candidates(
+    limit: int = 10,
+    order_by: CandidateOrder = CandidateOrder.priority,
+    after_id: Optional[int] = None,
+    after_value: Optional[float] = None,
+    fast: bool = False,
+    session: Session = Depends(get_session),
+):
+    candidates = get_candidates(
+        session,
+        limit=limit,
+        order_by=order_by,
+        after_id=after_id,
+        after_value=after_value,
+        raw=fast,
+    )
+    return fast_json_response(candidates) if fast else candidates
+
+
+@file_router.get("/changes", response_model=FileChanges)
+def read_changes(
+    since: int = 0,
+    after_id: Optional[int] = None,
+    limit: int = 1000,
+    fast: bool = False,
+    session: Session = Depends(get_session),
+):
+    """Files changed and deleted after revision `since`, for consumers keeping a copy"""
+    changes = get_changes(
+        session, since=since, after_id=after_id, limit=limit, raw=fast
+    )
+    return fast_json_response(changes) if fast else changes
 
 
 @file_router.get("/{file_id}", response_model=FileRead)
@@ -45,10 +242,147 @@ def read_file(file_id: int, session: Session = Depends(get_session)):
 
 
 @file_router.get("/", response_model=list[FileRead])
-def read_files(skip: int = 0, limit: int = 10, session: Session = Depends(get_session)):
-    return get_files(session, skip=skip, limit=limit)
+def read_files(
+    skip: int = 0,
+    limit: int = 10,
+    after_id: Optional[int] = None,
+    min_size: Optional[int] = None,
+    fast: bool = False,
+    session: Session = Depends(get_session),
+):
+    """List files; `fast` serializes rows directly instead of through FileRead"""
+    files = get_files(
+        session,
+        skip=skip,
+        limit=limit,
+        after_id=after_id,
+        min_size=min_size,
+        raw=fast,
+    )
+    return fast_json_response(files) if fast else files
+
+
+@file_router.delete("/", response_model=FilesDeleted)
+def delete_matching_files(
+    file_filter: FileDeleteFilter, session: Session = Depends(get_session)
+):
+    if file_filter.is_empty():
+        raise HTTPException(
+            status_code=400, detail="Refusing to delete with an empty filter"
+        )
+    return FilesDeleted(deleted=delete_files(session, file_filter))
 
 
 @file_router.delete("/{file_id}", response_model=bool)
 def delete_existing_file(file_id: int, session: Session = Depends(get_session)):
     return delete_file(session, file_id)
+
+
+job_router = APIRouter()
+
+
+@job_router.post("/enqueue", response_model=list[JobRead])
+def enqueue_new_jobs(
+    limit: int = 10,
+    order_by: CandidateOrder = CandidateOrder.priority,
+    session: Session = Depends(get_session),
+):
+    return enqueue_jobs(session, limit=limit, order_by=order_by)
+
+
+@job_router.get("/", response_model=list[JobRead])
+def read_jobs(
+    status: Optional[JobStatus] = None,
+    limit: int = 100,
+    session: Session = Depends(get_session),
+):
+    return get_jobs(session, status=status, limit=limit)
+
+
+@job_router.post("/claim", response_model=Optional[JobRead])
+def claim_next_job(lease: JobLease, session: Session = Depends(get_session)):
+    return claim_job(session, lease.worker, lease.lease_seconds)
+
+
+@job_router.post("/{job_id}/heartbeat", response_model=JobRead)
+def heartbeat_job(
+    job_id: int, lease: JobLease, session: Session = Depends(get_session)
+):
+    return leased_job_or_409(
+        update_leased_job(
+            session,
+            job_id,
+            lease.worker,
+            require_unexpired=True,
+            lease_expires_at=utcnow() + timedelta(seconds=lease.lease_seconds),
+        )
+    )
+
+
+@job_router.post("/{job_id}/complete", response_model=JobRead)
+def complete_job(
+    job_id: int, report: JobReport, session: Session = Depends(get_session)
+):
+    return leased_job_or_409(
+        update_leased_job(
+            session,
+            job_id,
+            report.worker,
+            status=JobStatus.done,
+            lease_expires_at=None,
+        )
+    )
+
+
+@job_router.post("/{job_id}/fail", response_model=JobRead)
+def fail_job(job_id: int, report: JobReport, session: Session = Depends(get_session)):
+    return leased_job_or_409(
+        update_leased_job(
+            session,
+            job_id,
+            report.worker,
+            status=JobStatus.failed,
+            error=report.error,
+            lease_expires_at=None,
+        )
+    )
+
+
+@job_router.post("/{job_id}/release", response_model=JobRead)
+def release_job(
+    job_id: int, report: JobReport, session: Session = Depends(get_session)
+):
+    """Hand an unfinished job back to the queue, e.g. when a worker is stopped"""
+    return leased_job_or_409(
+        update_leased_job(
+            session,
+            job_id,
+            report.worker,
+            status=JobStatus.queued,
+            worker=None,
+            lease_expires_at=None,
+        )
+    )
+
+
+def leased_job_or_409(job):
+    if job is None:
+        raise HTTPException(
+            status_code=409, detail="Job is not running under this worker's lease"
+        )
+    return job
+
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+def read_metrics(session: Session = Depends(get_session)):
+    """Metrics in the Prometheus text format; catalog gauges are read at scrape time"""
+    total_files, total_size, transcode_candidates = get_catalog_totals(session)
+    CATALOG_FILES.set(total_files)
+    CATALOG_BYTES.set(total_size)
+    TRANSCODE_CANDIDATES.set(transcode_candidates)
+    return PlainTextResponse(
+        render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -1,4 +1,6 @@
-from typing import List, Optional
+from datetime import datetime
+from enum import Enum
+from typing import Dict, List, Optional
 
 from sqlmodel import SQLModel
 
@@ -34,8 +36,14 @@ class FileCreate(SQLModel):
     filename: str
     file_extension: str
     file_size: int
+    file_mtime_ns: Optional[int] = None
     video_codec: Optional[str] = None
     video_resolution: Optional[str] = None
+    duration: Optional[float] = None
+    bit_rate: Optional[int] = None
+    fingerprint: Optional[str] = None
+    # Previous path of a file that was moved, so its row is kept rather than re-added
+    moved_from: Optional[str] = None
     audio_channels: Optional[List[AudioChannelCreate]] = []
     subtitle_channels: Optional[List[SubtitleChannelCreate]] = []
 
@@ -46,7 +54,145 @@ class FileRead(SQLModel):
     filename: str
     file_extension: str
     file_size: int
+    file_mtime_ns: Optional[int] = None
     video_codec: Optional[str] = None
     video_resolution: Optional[str] = None
+    duration: Optional[float] = None
+    bit_rate: Optional[int] = None
+    fingerprint: Optional[str] = None
+    priority: float = 0
+    revision: int = 0
     audio_channels: List[AudioChannelRead] = []
     subtitle_channels: List[SubtitleChannelRead] = []
+
+
+class IngestStatus(str, Enum):
+    inserted = "inserted"
+    updated = "updated"
+    unchanged = "unchanged"
+    moved = "moved"
+    # Failed validation and was skipped; the rest of the batch is still ingested
+    invalid = "invalid"
+
+
+class CandidateOrder(str, Enum):
+    id = "id"
+    size = "size"
+    priority = "priority"
+
+
+class FileUpsertRead(FileRead):
+    status: IngestStatus
+
+
+class FileIngestResult(SQLModel):
+    id: Optional[int] = None
+    filepath: Optional[str] = None
+    status: IngestStatus
+    error: Optional[str] = None
+
+
+class FileDeleteFilter(SQLModel):
+    """Files to delete: those listed by id or path, narrowed by the other fields.
+
+    Every given condition must match. An empty filter is refused; set `all`
+    to clear the whole catalog.
+    """
+
+    ids: List[int] = []
+    filepaths: List[str] = []
+    path_prefix: Optional[str] = None
+    video_codec: Optional[str] = None
+    all: bool = False
+
+    def is_empty(self) -> bool:
+        return not (
+            self.ids
+            or self.filepaths
+            or self.path_prefix
+            or self.video_codec
+            or self.all
+        )
+
+
+class FilesDeleted(SQLModel):
+    deleted: int
+
+
+class FileTombstoneRead(SQLModel):
+    file_id: int
+    filepath: str
+    revision: int
+
+
+class FileChanges(SQLModel):
+    """A page of files changed after a revision, oldest change first.
+
+    `revision` is the catalog revision when the page was read; a consumer
+    keeps the one from the first page and asks for changes since it next
+    time. Deletions are only listed on the first page.
+    """
+
+    catalog_id: str
+    revision: int
+    files: List[FileRead]
+    deleted: List[FileTombstoneRead]
+    complete: bool
+
+
+class DuplicateGroup(SQLModel):
+    fingerprint: str
+    file_size: int
+    filepaths: List[str]
+    # Bytes freed by keeping a single copy
+    reclaimable: int
+
+
+class CompatibleCodecs(SQLModel):
+    """Codecs Jellyfin can direct play; streams in any other codec are re-encoded"""
+
+    video: List[str]
+    audio: List[str]
+    subtitle: List[str]
+
+
+class CatalogStats(SQLModel):
+    total_files: int
+    total_size: int
+    max_file_size: Optional[int] = None
+    transcode_candidates: int
+    transcode_fraction: float
+    video_codecs: Dict[str, int]
+    audio_codecs: Dict[str, int]
+    subtitle_codecs: Dict[str, int]
+    resolutions: Dict[str, int]
+
+
+class JobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+
+class JobLease(SQLModel):
+    worker: str
+    lease_seconds: int = 600
+
+
+class JobReport(SQLModel):
+    worker: str
+    error: Optional[str] = None
+
+
+class JobRead(SQLModel):
+    id: int
+    file_id: Optional[int] = None
+    status: JobStatus
+    worker: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    attempts: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    file: Optional[FileRead] = None
@@ -0,0 +1,32 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# The engine is created when src.database is imported, so the database must be
+# chosen first
+os.environ["DATABASE_URL"] = (
+    f"sqlite:///{Path(tempfile.mkdtemp(prefix='jellyfier_test_')) / 'catalog.db'}"
+)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def client():
+    """A client for the app, starting from an empty catalog and job queue"""
+    from fastapi.testclient import TestClient
+    from sqlalchemy import delete
+    from sqlmodel import Session
+
+    from src.database import engine
+    from src.main import app
+    from src.models import TranscodeJob
+
+    with TestClient(app) as client:
+        client.request("DELETE", "/files/", json={"all": True})
+        with Session(engine) as session:
+            session.exec(delete(TranscodeJob))
+            session.commit()
+        yield client
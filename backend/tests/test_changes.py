@@ -0,0 +1,70 @@
+"""The change feed pages through changed files and lists deleted ones"""
+
+
+def file_payload(filepath, **fields):
+    return {
+        "filepath": filepath,
+        "filename": filepath.rsplit("/", 1)[-1],
+        "file_extension": ".mkv",
+        "file_size": 1000,
+        **fields,
+    }
+
+
+def ingest(client, *files):
+    response = client.post("/files/bulk", json=list(files))
+    response.raise_for_status()
+    return {result["filepath"]: result["id"] for result in response.json()}
+
+
+def changes(client, **params):
+    response = client.get("/files/changes", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_pages_continue_after_the_last_file(client):
+    since = changes(client)["revision"]
+    ids = ingest(client, *(file_payload(f"/media/{name}.mkv") for name in "abc"))
+
+    first = changes(client, since=since, limit=2)
+    assert [file["id"] for file in first["files"]] == sorted(ids.values())[:2]
+    assert not first["complete"]
+    assert first["revision"] == since + 1
+
+    # A page continues from the (revision, id) of the last file
+    last = first["files"][-1]
+    second = changes(client, since=last["revision"], after_id=last["id"], limit=2)
+    assert [file["id"] for file in second["files"]] == sorted(ids.values())[2:]
+    assert second["complete"]
+
+    assert changes(client, since=first["revision"]) == {
+        **first,
+        "files": [],
+        "complete": True,
+    }
+
+
+def test_deleted_files_leave_tombstones(client):
+    ids = ingest(client, file_payload("/media/a.mkv"), file_payload("/media/b.mkv"))
+    since = changes(client)["revision"]
+
+    ingest(client, file_payload("/media/a.mkv", file_size=2000))
+    client.request("DELETE", "/files/", json={"filepaths": ["/media/b.mkv"]})
+
+    page = changes(client, since=since)
+    assert [file["filepath"] for file in page["files"]] == ["/media/a.mkv"]
+    assert page["deleted"] == [
+        {
+            "file_id": ids["/media/b.mkv"],
+            "filepath": "/media/b.mkv",
+            "revision": page["revision"],
+        }
+    ]
+
+    # Deletions are only listed on the first page
+    last = page["files"][-1]
+    later = changes(client, since=last["revision"], after_id=last["id"])
+    assert later["deleted"] == []
+    # and not at all to a consumer that is already up to date
+    assert changes(client, since=page["revision"])["deleted"] == []
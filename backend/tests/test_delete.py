@@ -0,0 +1,71 @@
+"""Filtered deletes remove only the files matching every given condition"""
+
+import pytest
+
+
+def seed(client, *filepaths, **fields):
+    files = [
+        {
+            "filepath": filepath,
+            "filename": filepath.rsplit("/", 1)[-1],
+            "file_extension": ".mkv",
+            "file_size": 1000,
+            **fields,
+        }
+        for filepath in filepaths
+    ]
+    response = client.post("/files/bulk", json=files)
+    response.raise_for_status()
+    return {result["filepath"]: result["id"] for result in response.json()}
+
+
+def delete(client, **file_filter):
+    return client.request("DELETE", "/files/", json=file_filter)
+
+
+def remaining(client):
+    return sorted(file["filepath"] for file in client.get("/files/").json())
+
+
+def test_ids_and_filepaths_must_both_match(client):
+    ids = seed(client, "/media/a.mkv", "/media/b.mkv", "/media/c.mkv")
+
+    response = delete(
+        client,
+        ids=[ids["/media/a.mkv"], ids["/media/b.mkv"]],
+        filepaths=["/media/b.mkv", "/media/c.mkv"],
+    )
+    assert response.json() == {"deleted": 1}
+    assert remaining(client) == ["/media/a.mkv", "/media/c.mkv"]
+
+
+def test_conditions_narrow_the_listed_files(client):
+    ids = seed(client, "/media/tv/a.mkv", "/media/movies/b.mkv", video_codec="hevc")
+    seed(client, "/media/tv/c.mkv", video_codec="h264")
+
+    response = delete(
+        client,
+        ids=list(ids.values()),
+        path_prefix="/media/tv/",
+        video_codec="hevc",
+    )
+    assert response.json() == {"deleted": 1}
+    assert remaining(client) == ["/media/movies/b.mkv", "/media/tv/c.mkv"]
+
+
+@pytest.mark.parametrize(
+    "file_filter", [{}, {"ids": [], "filepaths": []}, {"all": False}]
+)
+def test_empty_filter_is_refused(client, file_filter):
+    seed(client, "/media/a.mkv")
+
+    response = delete(client, **file_filter)
+    assert response.status_code == 400
+    assert remaining(client) == ["/media/a.mkv"]
+
+
+def test_all_clears_the_catalog(client):
+    seed(client, "/media/a.mkv", "/media/b.mkv")
+
+    assert delete(client, all=True).json() == {"deleted": 2}
+    assert remaining(client) == []
@@ -0,0 +1,76 @@
+"""Ingesting a file again updates its row by filepath instead of adding another"""
+
+
+def file_payload(filepath, **fields):
+    return {
+        "filepath": filepath,
+        "filename": filepath.rsplit("/", 1)[-1],
+        "file_extension": ".mkv",
+        "file_size": 1000,
+        "file_mtime_ns": 1,
+        "video_codec": "hevc",
+        **fields,
+    }
+
+
+def ingest(client, *files):
+    response = client.post("/files/bulk", json=list(files))
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_upsert_reports_status_per_file(client):
+    [inserted] = ingest(client, file_payload("/media/a.mkv"))
+    assert inserted["status"] == "inserted"
+
+    results = ingest(
+        client,
+        file_payload("/media/a.mkv"),
+        file_payload("/media/b.mkv"),
+        file_payload("/media/a.mkv", file_size=2000),
+    )
+    assert [result["status"] for result in results] == [
+        "unchanged",
+        "inserted",
+        "updated",
+    ]
+    assert results[0]["id"] == results[2]["id"] == inserted["id"]
+
+    [unchanged] = ingest(client, file_payload("/media/a.mkv", file_size=2000))
+    assert unchanged["status"] == "unchanged"
+    assert len(client.get("/files/").json()) == 2
+
+
+def test_updated_file_replaces_its_channels(client):
+    channels = [{"name": "eng", "channel": "2", "codec": "ac3"}]
+    [result] = ingest(client, file_payload("/media/a.mkv", audio_channels=channels))
+    ingest(
+        client,
+        file_payload(
+            "/media/a.mkv",
+            file_mtime_ns=2,
+            audio_channels=[{"name": "jpn", "channel": "6", "codec": "aac"}],
+        ),
+    )
+
+    file = client.get(f"/files/{result['id']}").json()
+    assert [audio["name"] for audio in file["audio_channels"]] == ["jpn"]
+
+
+def test_moved_file_keeps_its_row(client):
+    [original] = ingest(client, file_payload("/media/old.mkv"))
+
+    [moved] = ingest(
+        client, file_payload("/media/new.mkv", moved_from="/media/old.mkv")
+    )
+    assert moved == {**original, "filepath": "/media/new.mkv", "status": "moved"}
+    files = client.get("/files/").json()
+    assert [file["filepath"] for file in files] == ["/media/new.mkv"]
+
+    # A path that's already catalogued keeps its own row
+    [other] = ingest(client, file_payload("/media/other.mkv"))
+    [result] = ingest(
+        client,
+        file_payload("/media/other.mkv", file_size=2000, moved_from="/media/new.mkv"),
+    )
+    assert (result["id"], result["status"]) == (other["id"], "updated")
@@ -0,0 +1,84 @@
+"""Workers lease jobs one at a time, and lose them once the lease expires"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+def enqueue(client, count):
+    files = [
+        {
+            "filepath": f"/media/Episode {index}.mkv",
+            "filename": f"Episode {index}.mkv",
+            "file_extension": ".mkv",
+            "file_size": 1000,
+            "video_codec": "hevc",
+        }
+        for index in range(count)
+    ]
+    client.post("/files/bulk", json=files).raise_for_status()
+    response = client.post("/jobs/enqueue", params={"limit": count})
+    assert response.status_code == 200
+    return [job["id"] for job in response.json()]
+
+
+def claim(client, worker, lease_seconds=600):
+    response = client.post(
+        "/jobs/claim", json={"worker": worker, "lease_seconds": lease_seconds}
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_concurrent_claims_lease_each_job_once(client):
+    job_ids = enqueue(client, 4)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        claimed = list(
+            pool.map(lambda index: claim(client, f"worker-{index}"), range(8))
+        )
+
+    jobs = [job for job in claimed if job is not None]
+    assert sorted(job["id"] for job in jobs) == job_ids
+    assert len({job["worker"] for job in jobs}) == len(jobs)
+    assert all(job["status"] == "running" for job in jobs)
+
+
+def test_only_the_leaseholder_can_report(client):
+    [job_id] = enqueue(client, 1)
+    claim(client, "worker-a")
+    assert claim(client, "worker-b") is None
+
+    response = client.post(f"/jobs/{job_id}/heartbeat", json={"worker": "worker-b"})
+    assert response.status_code == 409
+    response = client.post(f"/jobs/{job_id}/complete", json={"worker": "worker-a"})
+    assert response.status_code == 200
+    assert response.json()["status"] == "done"
+
+
+def test_expired_lease_is_reclaimed(client):
+    [job_id] = enqueue(client, 1)
+    claim(client, "worker-a", lease_seconds=0)
+
+    # An expired lease can't be extended, but the job can still be finished
+    # until another worker takes it over
+    response = client.post(
+        f"/jobs/{job_id}/heartbeat", json={"worker": "worker-a", "lease_seconds": 600}
+    )
+    assert response.status_code == 409
+
+    job = claim(client, "worker-b")
+    assert (job["id"], job["worker"], job["attempts"]) == (job_id, "worker-b", 2)
+
+    for action in ("heartbeat", "complete", "fail"):
+        response = client.post(f"/jobs/{job_id}/{action}", json={"worker": "worker-a"})
+        assert response.status_code == 409
+    response = client.post(f"/jobs/{job_id}/complete", json={"worker": "worker-b"})
+    assert response.json()["status"] == "done"
+
+
+def test_expired_lease_can_still_be_completed(client):
+    [job_id] = enqueue(client, 1)
+    claim(client, "worker-a", lease_seconds=0)
+
+    response = client.post(f"/jobs/{job_id}/complete", json={"worker": "worker-a"})
+    assert response.status_code == 200
+    assert response.json()["status"] == "done"
@@ -0,0 +1,75 @@
+"""Reading files takes a fixed number of queries, however many files there are"""
+
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from src.database import engine
+
+SIZES = (1, 20, 200)
+
+
+def file_payload(index):
+    return {
+        "filepath": f"/media/Show/Episode {index}.mkv",
+        "filename": f"Episode {index}.mkv",
+        "file_extension": ".mkv",
+        "file_size": 1000 + index,
+        "video_codec": "hevc",
+        "audio_channels": [
+            {"name": "eng", "channel": "6", "codec": "ac3"},
+            {"name": "jpn", "channel": "2", "codec": "aac"},
+        ],
+        "subtitle_channels": [{"name": "eng", "subtitle": "eng", "codec": "subrip"}],
+    }
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+def seed(client, count):
+    response = client.post(
+        "/files/bulk", json=[file_payload(index) for index in range(count)]
+    )
+    response.raise_for_status()
+    return [result["id"] for result in response.json()]
+
+
+def test_list_files_query_count_is_constant(client):
+    counts = []
+    for size in SIZES:
+        seed(client, size)
+        with count_queries() as statements:
+            response = client.get("/files/", params={"limit": size})
+        assert response.status_code == 200
+        files = response.json()
+        assert len(files) == size
+        assert all(len(file["audio_channels"]) == 2 for file in files)
+        counts.append(len(statements))
+
+    # The files, then one batched query per channel table
+    assert counts == [3] * len(SIZES)
+
+
+def test_read_file_query_count_is_constant(client):
+    counts = []
+    for size in SIZES:
+        file_ids = seed(client, size)
+        with count_queries() as statements:
+            response = client.get(f"/files/{file_ids[-1]}")
+        assert response.status_code == 200
+        assert len(response.json()["subtitle_channels"]) == 1
+        counts.append(len(statements))
+
+    assert counts == [3] * len(SIZES)
@@ -0,0 +1,132 @@
+"""Compare the FileRead and fast (orjson) serialization paths of the catalog endpoints.
+
+Builds a synthetic catalog in a temporary SQLite database and times full-page
+and streamed reads through the ASGI app, with and without compression:
+
+    python benchmarks/catalog_serialization.py --files 50000
+"""
+
+import argparse
+import os
+import random
+import sys
+
+from harness import BACKEND_DIR, timed, workspace
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+VIDEO_CODECS = ["h264", "hevc", "mpeg4", "vc1"]
+AUDIO_CODECS = ["aac", "ac3", "dts", "truehd", "flac"]
+SUBTITLE_CODECS = ["subrip", "ass", "hdmv_pgs_subtitle"]
+
+
+def synthetic_catalog(count, seed=0):
+    """Rows for the file, audio and subtitle channel tables"""
+    rng = random.Random(seed)
+    files, audio, subtitles = [], [], []
+    for file_id in range(1, count + 1):
+        files.append(
+            {
+                "id": file_id,
+                "filepath": f"/media/shows/Show {file_id // 100}/Season 1/Episode {file_id}.mkv",
+                "filename": f"Episode {file_id}.mkv",
+                "file_extension": ".mkv",
+                "file_size": rng.randint(200_000_000, 8_000_000_000),
+                "file_mtime_ns": 1_700_000_000_000_000_000 + file_id,
+                "video_codec": rng.choice(VIDEO_CODECS),
+                "video_resolution": rng.choice(["1920x1080", "1280x720", "3840x2160"]),
+                "duration": rng.uniform(1200, 7200),
+                "bit_rate": rng.randint(2_000_000, 40_000_000),
+                "fingerprint": f"{file_id}:{rng.getrandbits(128):032x}",
+                "priority": rng.uniform(0, 100),
+            }
+        )
+        for language in rng.sample(["eng", "jpn", "fre", "ger"], rng.randint(1, 3)):
+            audio.append(
+                {
+                    "file_id": file_id,
+                    "name": language,
+                    "channel": rng.choice(["2", "6", "8"]),
+                    "codec": rng.choice(AUDIO_CODECS),
+                }
+            )
+        for language in rng.sample(["eng", "fre", "ger", "spa"], rng.randint(0, 3)):
+            subtitles.append(
+                {
+                    "file_id": file_id,
+                    "name": language,
+                    "subtitle": f"{language} subtitles",
+                    "codec": rng.choice(SUBTITLE_CODECS),
+                }
+            )
+    return files, audio, subtitles
+
+
+def fetch(client, url, encoding):
+    """Status and size on the wire of a GET, reading the body without decoding it"""
+    with client.stream("GET", url, headers={"accept-encoding": encoding}) as response:
+        return response.status_code, sum(len(chunk) for chunk in response.iter_raw())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with workspace() as directory:
+        os.environ["DATABASE_URL"] = f"sqlite:///{directory}/catalog.db"
+
+        # The app reads DATABASE_URL at import time
+        from fastapi.testclient import TestClient
+        from sqlalchemy import insert
+        from src.database import create_db_and_tables, engine
+        from src.main import app
+        from src.models import AudioChannel, File, SubtitleChannel
+        from src.routers import orjson
+
+        create_db_and_tables()
+        files, audio, subtitles = synthetic_catalog(args.files)
+        with engine.begin() as connection:
+            connection.execute(insert(File), files)
+            connection.execute(insert(AudioChannel), audio)
+            connection.execute(insert(SubtitleChannel), subtitles)
+        print(
+            f"Catalog: {len(files)} files, {len(audio)} audio and {len(subtitles)} subtitle channels"
+        )
+        print(
+            f"Fast path encoder: {'orjson' if orjson else 'json (orjson not installed)'}\n"
+        )
+
+        endpoints = [
+            ("list", f"/files/?limit={args.files}"),
+            ("candidates", f"/files/candidates?limit={args.files}"),
+            ("stream", "/files/stream"),
+        ]
+        print(
+            f"{'endpoint':<12}{'path':<8}{'encoding':<10}{'median s':>10}{'bytes':>14}"
+        )
+        with TestClient(app) as client:
+            for name, url in endpoints:
+                baseline = None
+                for path in ("model", "fast"):
+                    separator = "&" if "?" in url else "?"
+                    request_url = url + (
+                        f"{separator}fast=true" if path == "fast" else ""
+                    )
+                    for encoding in ("identity", "gzip"):
+                        seconds, (status, size) = timed(
+                            lambda: fetch(client, request_url, encoding), args.repeat
+                        )
+                        if status != 200:
+                            raise SystemExit(f"GET {request_url} returned {status}")
+                        if baseline is None:
+                            baseline = seconds
+                        print(
+                            f"{name:<12}{path:<8}{encoding:<10}{seconds:>10.3f}{size:>14,}"
+                            f"  ({baseline / seconds:.1f}x)"
+                        )
+
+
+if __name__ == "__main__":
+    main()
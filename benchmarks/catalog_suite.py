@@ -0,0 +1,211 @@
+"""Time scanning, ingest and catalog reads on synthetic libraries of increasing size.
+
+Each size gets a fresh media tree, a fake ffprobe and a backend on a
+temporary SQLite database. Results are written as JSON; compare two runs
+with benchmarks/compare.py:
+
+    python benchmarks/catalog_suite.py --sizes 1000,10000,100000
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+import requests
+from harness import (
+    CLI,
+    MEDIA_MIXES,
+    REPO_ROOT,
+    SUBTITLE_CODECS,
+    backend,
+    git_revision,
+    make_media_tree,
+    timed,
+    workspace,
+    write_fake_ffprobe,
+    write_results,
+)
+
+PAGE_SIZE = 1000
+INGEST_BATCH_SIZE = 200
+# Single-file POSTs are slow enough that a sample gives the rate
+SINGLE_INGEST_SAMPLE = 1000
+
+
+def run_scan(tree, url, directory, bin_dir, jobs, full=False):
+    command = [sys.executable, str(CLI), "scan", str(tree), "--server-url", url]
+    command += ["--jobs", str(jobs)] + (["--full"] if full else [])
+    subprocess.run(
+        command,
+        env={
+            **os.environ,
+            "HOME": str(directory / "home"),
+            "PATH": f"{bin_dir}{os.pathsep}{os.environ['PATH']}",
+        },
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+
+
+def ingest_payload(count, prefix):
+    """File infos like the scanner sends, under paths the scan didn't create"""
+    files = []
+    for index in range(count):
+        video, audio, subtitles = MEDIA_MIXES[index % len(MEDIA_MIXES)]
+        files.append(
+            {
+                "filepath": f"{prefix}/Episode {index}.mkv",
+                "filename": f"Episode {index}.mkv",
+                "file_extension": ".mkv",
+                "file_size": 4096 + index,
+                "file_mtime_ns": 1_700_000_000_000_000_000 + index,
+                "video_codec": video,
+                "video_resolution": "1920x1080",
+                "duration": 1420.5,
+                "bit_rate": 4_000_000,
+                "fingerprint": f"{4096 + index}:{index:032x}",
+                "audio_channels": [
+                    {"name": "eng", "channel": "6", "codec": audio},
+                    {"name": "jpn", "channel": "2", "codec": "aac"},
+                ],
+                "subtitle_channels": [
+                    {
+                        "name": "eng",
+                        "subtitle": "eng",
+                        "codec": SUBTITLE_CODECS[subtitles],
+                    }
+                ],
+            }
+        )
+    return files
+
+
+def post_bulk(http, url, files):
+    for start in range(0, len(files), INGEST_BATCH_SIZE):
+        response = http.post(
+            f"{url}/files/bulk", json=files[start : start + INGEST_BATCH_SIZE]
+        )
+        response.raise_for_status()
+
+
+def post_each(http, url, files):
+    for file in files:
+        http.post(f"{url}/files/", json=file).raise_for_status()
+
+
+def read_pages(http, url, **params):
+    """Page through GET /files/ by id, returning the number of files read"""
+    total = 0
+    params = {"limit": PAGE_SIZE, **params}
+    while True:
+        page = http.get(f"{url}/files/", params=params).json()
+        total += len(page)
+        if len(page) < PAGE_SIZE:
+            return total
+        params["after_id"] = page[-1]["id"]
+
+
+def read_candidates(http, url):
+    """Page through every transcode candidate, as the transcode command does"""
+    total = 0
+    params = {"limit": PAGE_SIZE, "order_by": "priority", "fast": True}
+    while True:
+        page = http.get(f"{url}/files/candidates", params=params).json()
+        total += len(page)
+        if len(page) < PAGE_SIZE:
+            return total
+        params["after_id"] = page[-1]["id"]
+        params["after_value"] = page[-1]["priority"]
+
+
+def benchmark_size(size, repeat, jobs):
+    """Run every benchmark against a library of `size` files"""
+    results = []
+
+    def record(name, seconds, items=size, **extra):
+        results.append(
+            {
+                "benchmark": name,
+                "files": size,
+                "seconds": round(seconds, 4),
+                "items_per_second": round(items / seconds, 1) if seconds else None,
+                **extra,
+            }
+        )
+        print(f"{name:<28}{size:>8}{seconds:>12.3f}{items / seconds:>14,.0f}/s")
+
+    with workspace() as directory:
+        tree = directory / "library"
+        make_media_tree(tree, size)
+        bin_dir = directory / "bin"
+        write_fake_ffprobe(bin_dir)
+        # The CLI keeps its probe cache and config in the home directory
+        (directory / "home").mkdir()
+
+        with backend(directory) as url, requests.Session() as http:
+            # A cold scan fills the catalog that the read benchmarks use
+            seconds, _ = timed(lambda: run_scan(tree, url, directory, bin_dir, jobs), 1)
+            record("scan_cold", seconds, jobs=jobs)
+            seconds, _ = timed(
+                lambda: run_scan(tree, url, directory, bin_dir, jobs), repeat
+            )
+            record("scan_unchanged", seconds, jobs=jobs)
+            seconds, _ = timed(
+                lambda: run_scan(tree, url, directory, bin_dir, jobs, full=True), 1
+            )
+            record("scan_full", seconds, jobs=jobs)
+
+            for name, params in (
+                ("read_pages", {}),
+                ("read_pages_fast", {"fast": True}),
+            ):
+                seconds, count = timed(lambda: read_pages(http, url, **params), repeat)
+                assert count == size, f"read {count} of {size} files"
+                record(name, seconds)
+
+            seconds, count = timed(lambda: read_candidates(http, url), repeat)
+            record("candidates", seconds, items=count, candidates=count)
+
+            seconds, _ = timed(
+                lambda: http.get(f"{url}/files/stats").raise_for_status(), repeat
+            )
+            record("stats", seconds, items=1)
+
+            # Ingest runs last, as it grows the catalog
+            files = ingest_payload(size, "/ingest/bulk")
+            seconds, _ = timed(lambda: post_bulk(http, url, files), 1)
+            record("ingest_bulk_insert", seconds)
+            seconds, _ = timed(lambda: post_bulk(http, url, files), repeat)
+            record("ingest_bulk_unchanged", seconds)
+
+            sample = ingest_payload(min(size, SINGLE_INGEST_SAMPLE), "/ingest/single")
+            seconds, _ = timed(lambda: post_each(http, url, sample), 1)
+            record("ingest_single_insert", seconds, items=len(sample))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+    output = args.output or (
+        REPO_ROOT / "benchmarks" / "results" / f"catalog-{git_revision()}.json"
+    )
+
+    print(f"{'benchmark':<28}{'files':>8}{'median s':>12}{'rate':>16}")
+    results = []
+    for size in sizes:
+        results += benchmark_size(size, args.repeat, args.jobs)
+
+    write_results(
+        output, "catalog", results, sizes=sizes, repeat=args.repeat, jobs=args.jobs
+    )
+
+
+if __name__ == "__main__":
+    main()
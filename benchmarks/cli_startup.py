@@ -0,0 +1,90 @@
+"""Time CLI startup for commands that should feel instant, against a budget.
+
+Each command runs in a fresh interpreter with a throwaway home directory,
+and is compared with a bare interpreter start. Exits with status 1 when a
+median exceeds its budget:
+
+    python benchmarks/cli_startup.py --repeat 20
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from harness import CLI, REPO_ROOT, git_revision, workspace, write_results
+
+# Median wall time allowed per command, in seconds, including the ~20 ms the
+# interpreter itself needs. --help renders through typer's rich formatting.
+# Replacing the config makes ext4 flush the new file to disk, so a crash
+# can't leave it empty; that flush dominates `set` when the value changes.
+BUDGETS = {
+    "help": 0.2,
+    "set": 0.25,
+    "set_unchanged": 0.15,
+}
+
+
+def run_once(command, env):
+    start = time.perf_counter()
+    subprocess.run(command, env=env, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=15)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+    output = args.output or (
+        REPO_ROOT / "benchmarks" / "results" / f"cli-startup-{git_revision()}.json"
+    )
+
+    cli = [sys.executable, str(CLI)]
+    # Command lines of each benchmark, by run index
+    commands = {
+        "python_bare": lambda index: [sys.executable, "-c", "pass"],
+        "help": lambda index: [*cli, "--help"],
+        # Alternating values make every run rewrite the config
+        "set": lambda index: [*cli, "set", "workers", str(index % 2)],
+        "set_unchanged": lambda index: [*cli, "set", "server_url", "http://localhost"],
+    }
+
+    results = []
+    over_budget = 0
+    print(f"{'command':<16}{'median s':>10}{'max s':>10}{'budget s':>10}")
+    with workspace() as directory:
+        env = {**os.environ, "HOME": str(directory)}
+        # Start from an existing config, as `set` usually does
+        run_once(commands["set_unchanged"](0), env)
+
+        for name, command in commands.items():
+            times = [run_once(command(index), env) for index in range(args.repeat)]
+            seconds = statistics.median(times)
+            budget = BUDGETS.get(name)
+            over = budget is not None and seconds > budget
+            over_budget += over
+            print(
+                f"{name:<16}{seconds:>10.3f}{max(times):>10.3f}{budget or '':>10}"
+                f"{'  ⚠️' if over else ''}"
+            )
+            results.append(
+                {
+                    "benchmark": f"cli_{name}",
+                    "files": 0,
+                    "seconds": round(seconds, 4),
+                    "max_seconds": round(max(times), 4),
+                    "budget_seconds": budget,
+                }
+            )
+
+    write_results(output, "cli_startup", results, repeat=args.repeat)
+    if over_budget:
+        print(f"\n{over_budget} commands are over their startup budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
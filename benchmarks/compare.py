@@ -0,0 +1,66 @@
+"""Compare two benchmark result files, e.g. from the parent commit and this one.
+
+    python benchmarks/compare.py results/catalog-abc123.json results/catalog-def456.json
+
+Exits with status 1 when a benchmark got slower by more than --threshold.
+"""
+
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as file:
+        document = json.load(file)
+    results = {
+        (result["benchmark"], result["files"]): result["seconds"]
+        for result in document["results"]
+    }
+    return document, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative slowdown counted as a regression",
+    )
+    args = parser.parse_args()
+
+    baseline_document, baseline = load(args.baseline)
+    current_document, current = load(args.current)
+    print(
+        f"Baseline: {baseline_document['revision']}  Current: {current_document['revision']}\n"
+    )
+    print(
+        f"{'benchmark':<28}{'files':>8}{'baseline s':>12}{'current s':>12}{'change':>10}"
+    )
+
+    regressions = 0
+    for key in sorted(
+        baseline.keys() & current.keys(), key=lambda key: (key[1], key[0])
+    ):
+        change = current[key] / baseline[key] - 1 if baseline[key] else 0
+        regressed = change > args.threshold
+        regressions += regressed
+        print(
+            f"{key[0]:<28}{key[1]:>8}{baseline[key]:>12.3f}{current[key]:>12.3f}"
+            f"{change:>+10.1%}{'  ⚠️' if regressed else ''}"
+        )
+    for key in sorted(baseline.keys() ^ current.keys()):
+        print(
+            f"{key[0]:<28}{key[1]:>8}  only in {'baseline' if key in baseline else 'current'}"
+        )
+
+    if regressions:
+        print(f"\n{regressions} benchmarks regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
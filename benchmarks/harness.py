@@ -0,0 +1,177 @@
+"""Shared pieces of the benchmarks: synthetic libraries, a fake ffprobe, a throwaway backend"""
+
+import itertools
+import json
+import os
+import platform
+import shlex
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import requests
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BACKEND_DIR = REPO_ROOT / "backend"
+CLI = REPO_ROOT / "cli" / "main.py"
+
+# Codec mixes of the synthetic library, encoded in each file name so the fake
+# ffprobe can answer without reading the file
+VIDEO_CODECS = ["h264", "hevc"]
+AUDIO_CODECS = ["aac", "ac3", "dts"]
+SUBTITLE_CODECS = {"srt": "subrip", "pgs": "hdmv_pgs_subtitle"}
+MEDIA_MIXES = list(itertools.product(VIDEO_CODECS, AUDIO_CODECS, SUBTITLE_CODECS))
+
+
+def timed(function, repeat):
+    """Median wall time of `repeat` calls, and the last result"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def make_media_tree(root, count, files_per_directory=20):
+    """Create `count` small media files spread over show/season directories"""
+    paths = []
+    for index in range(count):
+        video, audio, subtitles = MEDIA_MIXES[index % len(MEDIA_MIXES)]
+        directory = (
+            root
+            / f"Show {index // (files_per_directory * 10)}"
+            / f"Season {index // files_per_directory % 10 + 1}"
+        )
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"Episode {index}_{video}_{audio}_{subtitles}.mkv"
+        # Distinct content, so no two files share a fingerprint
+        path.write_bytes(index.to_bytes(8, "little") * 512)
+        paths.append(path)
+    return paths
+
+
+def probe_output(video, audio, subtitles):
+    """Canned ffprobe JSON for a media mix"""
+    return {
+        "streams": [
+            {"codec_type": "video", "codec_name": video, "width": 1920, "height": 1080},
+            {"codec_type": "audio", "codec_name": audio, "tags": {"language": "eng"}},
+            {"codec_type": "audio", "codec_name": "aac", "tags": {"language": "jpn"}},
+            {
+                "codec_type": "subtitle",
+                "codec_name": SUBTITLE_CODECS[subtitles],
+                "tags": {"language": "eng"},
+            },
+        ],
+        "format": {"duration": "1420.5", "bit_rate": "4000000"},
+    }
+
+
+def write_fake_ffprobe(bin_dir):
+    """A POSIX shell ffprobe printing canned JSON picked by file name, cheap to spawn"""
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    cases = "\n".join(
+        f"    *_{video}_{audio}_{subtitles}.mkv) printf '%s\\n' "
+        f"{shlex.quote(json.dumps(probe_output(video, audio, subtitles)))} ;;"
+        for video, audio, subtitles in MEDIA_MIXES
+    )
+    script = bin_dir / "ffprobe"
+    script.write_text(
+        "#!/bin/sh\n"
+        "# Benchmark stand-in for ffprobe; the file is the last argument\n"
+        'for last; do :; done\ncase "$last" in\n'
+        f"{cases}\n"
+        "    *) echo 'unknown media' >&2; exit 1 ;;\nesac\n"
+    )
+    script.chmod(0o755)
+    return script
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def backend(directory, env=None):
+    """Run the FastAPI app under uvicorn on a fresh SQLite database, yielding its URL"""
+    port = free_port()
+    database = Path(directory) / "catalog.db"
+    log = open(Path(directory) / "backend.log", "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(port)],
+        cwd=BACKEND_DIR,
+        env={**os.environ, "DATABASE_URL": f"sqlite:///{database}", **(env or {})},
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                requests.get(url, timeout=1)
+                break
+            except requests.ConnectionError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f"Backend failed to start, see {log.name}")
+                time.sleep(0.1)
+        yield url
+    finally:
+        process.terminate()
+        process.wait()
+        log.close()
+
+
+@contextmanager
+def workspace(prefix="jellyfier_bench_"):
+    """Temporary directory for a benchmark run, removed afterwards"""
+    with tempfile.TemporaryDirectory(prefix=prefix) as directory:
+        yield Path(directory)
+
+
+def git_revision():
+    """Short commit hash of the tree being measured, marked if it has local changes"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+def write_results(path, suite, results, **settings):
+    """Save results with what is needed to compare them across commits"""
+    document = {
+        "suite": suite,
+        "revision": git_revision(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": settings,
+        "results": results,
+    }
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(document, indent=2) + "\n")
+    print(f"\nResults written to {path}")
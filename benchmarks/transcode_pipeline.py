@@ -0,0 +1,285 @@
+"""Time the transcode pipeline end to end on clips generated with ffmpeg's lavfi sources.
+
+Every combination of worker count and copy strategy transcodes a fresh copy
+of the same clips through the CLI's pipeline against a throwaway backend,
+reporting per-stage wall time, bytes copied and CPU utilization. Needs real
+ffmpeg and ffprobe on PATH:
+
+    python benchmarks/transcode_pipeline.py --clips 8 --workers 1,2,4
+"""
+
+import argparse
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from harness import (
+    CLI,
+    REPO_ROOT,
+    backend,
+    git_revision,
+    workspace,
+    write_results,
+)
+
+sys.path.insert(0, str(CLI.parent))
+import main as cli  # noqa: E402
+
+# Codec mixes the candidate query selects, as (name, video, audio, subtitle
+# encoder, container). ffmpeg can't encode bitmap subtitles from a text
+# source, so PGS/DVD subtitles are stood in for by mov_text, which also has
+# to be converted. Files with PGS subtitles are skipped as candidates anyway.
+CLIP_MIXES = [
+    ("hevc_ac3_srt", "libx265", "ac3", "srt", ".mkv"),
+    ("h264_dts_ass", "libx264", "dca", "ass", ".mkv"),
+    ("hevc_aac_movtext", "libx265", "aac", "mov_text", ".mp4"),
+]
+
+SUBTITLES = """1
+00:00:00,500 --> 00:00:02,000
+Benchmark clip
+
+2
+00:00:02,500 --> 00:00:04,000
+Second line
+"""
+
+# Names of the pipeline stages, and the CLI functions that run them
+STAGES = {
+    "copy": "copy_job_input",
+    "encode": "encode_job",
+    "transfer": "post_transcode_operations",
+}
+
+
+def make_clip(path, mix, duration, size, subtitles_path):
+    _, video, audio, subtitles, _ = mix
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-y",
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-f",
+            "lavfi",
+            "-i",
+            f"testsrc2=size={size}:rate=24:duration={duration}",
+            "-f",
+            "lavfi",
+            "-i",
+            f"sine=frequency=440:sample_rate=48000:duration={duration}",
+            "-i",
+            str(subtitles_path),
+            "-map",
+            "0:v",
+            "-map",
+            "1:a",
+            "-map",
+            "2:s",
+            "-c:v",
+            video,
+            "-preset",
+            "ultrafast",
+            "-c:a",
+            audio,
+            "-ac",
+            "6",
+            # The DTS encoder is marked experimental
+            "-strict",
+            "-2",
+            "-c:s",
+            subtitles,
+            str(path),
+        ],
+        check=True,
+    )
+
+
+def make_clips(directory, count, duration, size):
+    directory.mkdir(parents=True, exist_ok=True)
+    subtitles_path = directory / "subtitles.srt"
+    subtitles_path.write_text(SUBTITLES)
+    for index in range(count):
+        mix = CLIP_MIXES[index % len(CLIP_MIXES)]
+        make_clip(
+            directory / f"clip{index}_{mix[0]}{mix[4]}",
+            mix,
+            duration,
+            size,
+            subtitles_path,
+        )
+    subtitles_path.unlink()
+
+
+def cpu_seconds():
+    """CPU time of this process and its waited-for children, i.e. ffmpeg"""
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+@contextmanager
+def instrumented_stages(temp_directory):
+    """Record when each job enters and leaves each stage, and the bytes it copies"""
+    spans = defaultdict(list)
+    bytes_copied = defaultdict(int)
+    lock = threading.Lock()
+    current = threading.local()
+    originals = {name: getattr(cli, name) for name in [*STAGES.values(), "copy_file"]}
+
+    def timed_stage(stage, function):
+        def run(job, cancel, **kwargs):
+            current.stage = stage
+            start = time.perf_counter()
+            try:
+                return function(job, cancel, **kwargs)
+            finally:
+                with lock:
+                    spans[stage].append((start, time.perf_counter()))
+
+        return run
+
+    def counted_copy(source, destination):
+        with lock:
+            bytes_copied[getattr(current, "stage", "other")] += os.path.getsize(source)
+        return originals["copy_file"](source, destination)
+
+    for stage, name in STAGES.items():
+        setattr(cli, name, timed_stage(stage, originals[name]))
+    cli.copy_file = counted_copy
+    original_temp_directory = cli.temp_transcode_path
+    cli.temp_transcode_path = temp_directory
+    try:
+        yield spans, bytes_copied
+    finally:
+        for name, function in originals.items():
+            setattr(cli, name, function)
+        cli.temp_transcode_path = original_temp_directory
+
+
+def run_configuration(clips, directory, workers, copy_strategy):
+    """Transcode a fresh copy of `clips` and measure the run"""
+    library = directory / "library"
+    shutil.copytree(clips, library)
+    home = directory / "home"
+    home.mkdir()
+    temp_directory = directory / "tmp"
+    temp_directory.mkdir()
+
+    with backend(directory) as url:
+        subprocess.run(
+            [sys.executable, str(CLI), "scan", str(library), "--server-url", url],
+            env={**os.environ, "HOME": str(home)},
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+        with instrumented_stages(temp_directory) as (spans, bytes_copied):
+            codecs = cli.get_compatible_codecs(url)
+            jobs = [
+                cli.new_job(file, cli.plan_transcode(file, codecs), copy_strategy)
+                for file in cli.get_candidates(url)
+            ]
+            with cli.Journal(directory / "journal.jsonl") as journal:
+                cpu_start = cpu_seconds()
+                start = time.perf_counter()
+                cli.run_jobs(jobs, url, workers, False, journal, threading.Event())
+                wall = time.perf_counter() - start
+                cpu = cpu_seconds() - cpu_start
+
+    stages = {}
+    for stage in STAGES:
+        stage_spans = spans[stage]
+        stages[stage] = {
+            "busy_seconds": round(sum(end - begin for begin, end in stage_spans), 4),
+            "span_seconds": round(
+                max(end for _, end in stage_spans)
+                - min(begin for begin, _ in stage_spans),
+                4,
+            )
+            if stage_spans
+            else 0,
+            "bytes_copied": bytes_copied[stage],
+        }
+    return {
+        "benchmark": f"transcode_{copy_strategy.value}_w{workers}",
+        "files": len(jobs),
+        "seconds": round(wall, 4),
+        "workers": workers,
+        "copy_strategy": copy_strategy.value,
+        "failed": sum(job["failed"] for job in jobs),
+        "cpu_seconds": round(cpu, 3),
+        "cpu_utilization": round(cpu / (wall * os.cpu_count()), 3),
+        "stages": stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clips", type=int, default=6)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument(
+        "--copy-strategies",
+        default=",".join(strategy.value for strategy in cli.CopyStrategy),
+    )
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+    workers = [int(count) for count in args.workers.split(",")]
+    strategies = [cli.CopyStrategy(name) for name in args.copy_strategies.split(",")]
+    output = args.output or (
+        REPO_ROOT / "benchmarks" / "results" / f"transcode-{git_revision()}.json"
+    )
+
+    for tool in ("ffmpeg", "ffprobe"):
+        if shutil.which(tool) is None:
+            raise SystemExit(f"{tool} is needed on PATH to run this benchmark")
+
+    results = []
+    with workspace() as directory:
+        clips = directory / "clips"
+        print(f"Generating {args.clips} clips of {args.duration}s at {args.size}")
+        make_clips(clips, args.clips, args.duration, args.size)
+
+        for copy_strategy in strategies:
+            for count in workers:
+                with workspace() as run_directory:
+                    results.append(
+                        run_configuration(clips, run_directory, count, copy_strategy)
+                    )
+
+    print(
+        f"\n{'strategy':<10}{'workers':>8}{'wall s':>9}{'cpu %':>7}"
+        f"{'copy s':>9}{'encode s':>10}{'transfer s':>12}{'MB copied':>11}{'failed':>8}"
+    )
+    for result in results:
+        stages = result["stages"]
+        copied = sum(stage["bytes_copied"] for stage in stages.values())
+        print(
+            f"{result['copy_strategy']:<10}{result['workers']:>8}{result['seconds']:>9.2f}"
+            f"{result['cpu_utilization']:>7.0%}"
+            f"{stages['copy']['busy_seconds']:>9.2f}{stages['encode']['busy_seconds']:>10.2f}"
+            f"{stages['transfer']['busy_seconds']:>12.2f}{copied / 1e6:>11.1f}{result['failed']:>8}"
+        )
+
+    write_results(
+        output,
+        "transcode",
+        results,
+        clips=args.clips,
+        duration=args.duration,
+        size=args.size,
+    )
+
+
+if __name__ == "__main__":
+    main()
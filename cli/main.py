@@ -1,152 +1,993 @@
+import ctypes
+import ctypes.util
+import fcntl
+import hashlib
 import json
 import os
+import queue
+import select
 import shutil
+import socket
+import sqlite3
+import struct
 import subprocess
 import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from functools import partial
 from pathlib import Path
 
-import requests
 import typer
 from rich import print
-from rich.progress import Progress
 
-config_path = Path.home() / ".jellyfier"
+config_path = Path.home() / ".jellyfier.toml"
+# Key=value lines written by older versions, read until the next `set`
+legacy_config_path = Path.home() / ".jellyfier"
+cache_path = Path.home() / ".jellyfier_cache.sqlite"
+snapshot_path = Path.home() / ".jellyfier_catalog.sqlite"
+journal_path = Path.home() / ".jellyfier_journal.jsonl"
 temp_transcode_path = Path("/tmp/jellyfier_transcode")
-temp_transcode_path.mkdir(exist_ok=True)
 
 app = typer.Typer()
 
 # ========== Config ==========
 
 
+# Parsed config file, loaded on first use
+_config = None
+
+
+def load_config() -> dict:
+    global _config
+    if _config is None:
+        if config_path.exists():
+            try:
+                import tomllib
+            except ModuleNotFoundError:  # Python 3.10
+                import tomli as tomllib
+
+            with open(config_path, "rb") as config_file:
+                _config = tomllib.load(config_file)
+        elif legacy_config_path.exists():
+            _config = read_legacy_config(legacy_config_path)
+        else:
+            _config = {}
+    return _config
+
+
+def read_legacy_config(path) -> dict:
+    config = {}
+    with open(path) as config_file:
+        for line in config_file:
+            key, separator, value = line.partition("=")
+            # Values were appended, so the last one of a key is current
+            if separator:
+                config[key.strip()] = value.strip()
+    return config
+
+
+def toml_value(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    # JSON string escapes are valid in TOML basic strings, except for DEL
+    return json.dumps(str(value), ensure_ascii=False).replace("\x7f", "\\u007f")
+
+
+def write_config(config):
+    """Replace the config file atomically, so readers never see half of it"""
+    temp_path = config_path.with_suffix(".tmp")
+    temp_path.write_text(
+        "".join(
+            f"{toml_value(key)} = {toml_value(value)}\n"
+            for key, value in config.items()
+        )
+    )
+    os.replace(temp_path, config_path)
+
+
 @app.command()
 def set(key: str, value: str):
     print(f"🔧 Setting {key}={value}")
-
-    if not config_path.exists():
-        config_path.touch()
-
-    with open(config_path, "a") as config_file:
-        config_file.write(f"{key}={value}\n")
+    config = load_config()
+    if config.get(key) != value or not config_path.exists():
+        write_config({**config, key: value})
+        config[key] = value
 
 
 def get(key: str) -> str:
-    if not config_path.exists():
+    """The configured value of `key`; a JELLYFIER_<KEY> environment variable wins"""
+    value = os.environ.get(f"JELLYFIER_{key.upper()}")
+    if value is not None:
+        return value
+
+    config = load_config()
+    if key in config:
+        return str(config[key])
+    if not config:
         print("⚠️ No configuration found")
         raise typer.Exit()
 
-    with open(config_path) as config_file:
-        for line in config_file:
-            if line.startswith(key):
-                return line.split("=")[1].strip()
-
     raise KeyError(
         f"⚠️ Configuration for {key} not found. Run `jellyfier set {key} <value>`"
     )
 
 
+# ========== Probe cache ==========
+
+
+class ProbeCache:
+    """Local SQLite store of probe results keyed by (filepath, size, mtime, inode)"""
+
+    commit_every = 500
+
+    def __init__(self, path=cache_path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS probe (
+                filepath TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                file_info TEXT NOT NULL,
+                fingerprint TEXT
+            )
+            """
+        )
+        columns = {
+            row[1] for row in self.connection.execute("PRAGMA table_info(probe)")
+        }
+        if "fingerprint" not in columns:
+            self.connection.execute("ALTER TABLE probe ADD COLUMN fingerprint TEXT")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS probe_inode ON probe (inode)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS probe_fingerprint ON probe (fingerprint)"
+        )
+        self.pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.connection.commit()
+        self.connection.close()
+
+    def is_fresh(self, file_path, stat):
+        row = self.connection.execute(
+            "SELECT size, mtime_ns, inode FROM probe WHERE filepath = ?",
+            (str(file_path),),
+        ).fetchone()
+        return row == (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+    def put(self, file_path, stat, file_info):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO probe VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                str(file_path),
+                stat.st_size,
+                stat.st_mtime_ns,
+                stat.st_ino,
+                json.dumps(file_info),
+                file_info.get("fingerprint"),
+            ),
+        )
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.connection.commit()
+            self.pending = 0
+
+    def find_by_inode(self, stat):
+        """(filepath, file_info) of a file with the same inode, size and mtime"""
+        row = self.connection.execute(
+            "SELECT filepath, file_info FROM probe WHERE inode = ? AND size = ? AND mtime_ns = ?",
+            (stat.st_ino, stat.st_size, stat.st_mtime_ns),
+        ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def find_by_fingerprint(self, fingerprint, file_path):
+        """(filepath, file_info) of another file with the same content fingerprint"""
+        # The file's own stale row would match after a touch or a small edit
+        row = self.connection.execute(
+            "SELECT filepath, file_info FROM probe WHERE fingerprint = ? AND filepath != ?",
+            (fingerprint, str(file_path)),
+        ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def paths_under(self, directory):
+        prefix = os.path.join(directory, "")
+        return [
+            filepath
+            for (filepath,) in self.connection.execute(
+                "SELECT filepath FROM probe WHERE substr(filepath, 1, ?) = ?",
+                (len(prefix), prefix),
+            )
+        ]
+
+    def remove(self, filepaths):
+        self.connection.executemany(
+            "DELETE FROM probe WHERE filepath = ?",
+            [(filepath,) for filepath in filepaths],
+        )
+        self.connection.commit()
+
+    def commit(self):
+        self.connection.commit()
+        self.pending = 0
+
+    def prune(self):
+        """Drop entries whose path no longer exists, returning how many were removed"""
+        missing = [
+            (filepath,)
+            for (filepath,) in self.connection.execute("SELECT filepath FROM probe")
+            if not os.path.exists(filepath)
+        ]
+        self.connection.executemany("DELETE FROM probe WHERE filepath = ?", missing)
+        self.connection.commit()
+        return len(missing)
+
+
+@app.command()
+def prune_cache():
+    """Remove probe cache entries for files that no longer exist"""
+    with ProbeCache() as cache:
+        removed = cache.prune()
+    print(f"🧹 Removed {removed} stale entries from {cache_path}")
+
+
 # ========== Scanner ==========
 
 
+media_extensions = {".mp4", ".mkv", ".avi", ".mov", ".flv", ".wmv"}
+
+
 @app.command()
-def scan(path: Path, server_url: str | None = None, dry_run: bool = False):
+def scan(
+    path: Path,
+    server_url: str | None = None,
+    dry_run: bool = False,
+    full: bool = False,
+    jobs: int = 4,
+    probe_timeout: float = 60,
+    batch_size: int = 200,
+    watch: bool = False,
+    settle: float = 5,
+    poll: bool = False,
+    poll_interval: float = 30,
+):
+    import requests
+
     if server_url is None:
         server_url = get("server_url")
 
     print(f"🔍 Scanning {path}")
 
-    media_extensions = {".mp4", ".mkv", ".avi", ".mov", ".flv", ".wmv"}
-    for root, _, files in os.walk(path):
-        for file in files:
-            file_path = Path(root) / file
-            if file_path.suffix.lower() in media_extensions:
-                file_info = get_file_info(file_path)
-                if file_info is None:
+    with ProbeCache() as cache, requests.Session() as http:
+        stats = {}
+        unchanged = 0
+        batch = []
+
+        def flush():
+            results = send_files_info_to_server(
+                http, [file_info for _, _, file_info in batch], server_url
+            )
+            if results is not None:
+                cache_sent_files(cache, batch, results)
+            batch.clear()
+
+        def changed_files():
+            nonlocal unchanged
+            for file_path in iter_media_files(path):
+                # Broken symlinks, and files deleted since the walk listed them
+                try:
+                    stat = file_path.stat()
+                except OSError as e:
+                    report_probe_error(file_path, e)
+                    continue
+                if not full and cache.is_fresh(file_path, stat):
+                    unchanged += 1
                     continue
-                if dry_run:
+                try:
+                    file_info = (
+                        None if full else find_cached_probe(cache, file_path, stat)
+                    )
+                except OSError as e:
+                    report_probe_error(file_path, e)
+                    continue
+                if file_info is None:
+                    stats[file_path] = stat
+                    yield file_path
+                elif dry_run:
                     print(json.dumps(file_info, indent=4))
                 else:
-                    send_file_info_to_server(file_info, server_url)
+                    batch.append((file_path, stat, file_info))
+                    if len(batch) >= batch_size:
+                        flush()
+
+        for file_path, file_info, error in probe_files(
+            changed_files(), jobs=jobs, timeout=probe_timeout
+        ):
+            stat = stats.pop(file_path)
+            if error is not None:
+                report_probe_error(file_path, error)
+                continue
+            if dry_run:
+                print(json.dumps(file_info, indent=4))
+                continue
+            batch.append((file_path, stat, file_info))
+            if len(batch) >= batch_size:
+                flush()
+
+        if batch:
+            flush()
+
+        if unchanged:
+            print(f"⏭️ Skipped {unchanged} unchanged files")
+
+        if watch and not dry_run:
+            # inotify doesn't see changes made by other machines on network shares
+            watcher = None if poll else start_inotify(path)
+            if watcher is None:
+                watcher = PollingWatcher(path, poll_interval)
+                print(f"👀 Checking {path} for changes every {poll_interval}s")
+            watch_library(
+                path, watcher, cache, http, server_url, jobs, probe_timeout, settle
+            )
 
 
-def get_file_info(file_path):
-    try:
-        file_info = {
-            "filepath": str(file_path),
-            "filename": file_path.name,
-            "file_extension": file_path.suffix,
-            "file_size": file_path.stat().st_size,
-            "video_codec": None,
-            "video_resolution": None,
-            "audio_channels": [],
-            "subtitle_channels": [],
+def find_cached_probe(cache, file_path, stat):
+    """Reuse the probe results of the same content cached under another path.
+
+    Renames keep the inode, so they are found without reading the file; moves
+    across filesystems and copies are found by fingerprint. When the old path
+    is gone the file was moved, and the server is told to update its row.
+    """
+    fingerprint = None
+    match = cache.find_by_inode(stat)
+    if match is None:
+        fingerprint = fingerprint_file(file_path)
+        match = cache.find_by_fingerprint(fingerprint, file_path)
+    if match is None:
+        return None
+
+    old_path, file_info = match
+    if fingerprint is not None:
+        file_info["fingerprint"] = fingerprint
+    moved = not os.path.exists(old_path)
+    print(
+        f"🔀 {file_path} is {'a move' if moved else 'a copy'} of {old_path}, reusing its probe results"
+    )
+    file_info.update(
+        filepath=str(file_path),
+        filename=file_path.name,
+        file_extension=file_path.suffix,
+        file_mtime_ns=stat.st_mtime_ns,
+        moved_from=old_path if moved else None,
+    )
+    return file_info
+
+
+def cache_sent_files(cache, files, results):
+    """Cache the probes of the files the server ingested, so rejected ones are retried"""
+    files = [
+        file for file, result in zip(files, results) if result["status"] != "invalid"
+    ]
+    for file_path, stat, file_info in files:
+        cache.put(file_path, stat, file_info)
+    moved_from = [
+        file_info["moved_from"]
+        for _, _, file_info in files
+        if file_info.get("moved_from")
+    ]
+    if moved_from:
+        cache.remove(moved_from)
+
+
+# Blocks hashed at the start, middle and end of a file for its fingerprint
+FINGERPRINT_BLOCK_SIZE = 1024 * 1024
+
+
+def fingerprint_file(file_path):
+    """Size plus a BLAKE2b hash of the first, middle and last MiB of the file"""
+    size = os.path.getsize(file_path)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb", buffering=0) as file:
+        offsets = {
+            0,
+            max(size // 2 - FINGERPRINT_BLOCK_SIZE // 2, 0),
+            max(size - FINGERPRINT_BLOCK_SIZE, 0),
         }
+        for offset in sorted(offsets):
+            digest.update(os.pread(file.fileno(), FINGERPRINT_BLOCK_SIZE, offset))
+    return f"{size}:{digest.hexdigest()}"
 
-        # Run ffprobe to get detailed information about the file
-        result = subprocess.run(
-            [
-                "ffprobe",
-                "-v",
-                "error",
-                "-print_format",
-                "json",
-                "-show_streams",
-                str(file_path),
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-        ffprobe_output = json.loads(result.stdout)
 
-        for stream in ffprobe_output.get("streams", []):
-            if stream["codec_type"] == "video":
-                file_info["video_codec"] = stream.get("codec_name")
-                file_info["video_resolution"] = (
-                    f"{stream.get('width')}x{stream.get('height')}"
-                )
-            elif stream["codec_type"] == "audio":
-                audio_channel = {
-                    "name": stream.get("tags", {}).get("title", "unknown"),
-                    "channel": stream.get("tags", {}).get("language", "unknown"),
-                    "codec": stream.get("codec_name"),
-                }
-                file_info["audio_channels"].append(audio_channel)
-            elif stream["codec_type"] == "subtitle":
-                subtitle_channel = {
-                    "name": stream.get("tags", {}).get("title", "unknown"),
-                    "subtitle": stream.get("tags", {}).get("language", "unknown"),
-                    "codec": stream.get("codec_name"),
-                }
-                file_info["subtitle_channels"].append(subtitle_channel)
-
-    except FileNotFoundError:
+def is_media_file(file_path):
+    """Media files, except hidden ones such as transcode output being staged"""
+    return (
+        file_path.suffix.lower() in media_extensions
+        and not file_path.name.startswith(".")
+        and not file_path.name.endswith(".jellyfied.mkv")
+    )
+
+
+def iter_media_files(path):
+    for root, _, files in os.walk(path):
+        for file in files:
+            file_path = Path(root) / file
+            if is_media_file(file_path):
+                yield file_path
+
+
+def probe_files(file_paths, jobs=1, timeout=None):
+    """Probe files on a bounded thread pool, yielding (path, info, error) in input order"""
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        pending = deque()
+        for file_path in file_paths:
+            pending.append((file_path, executor.submit(probe_file, file_path, timeout)))
+            # Keep the walk streaming without queueing the whole tree
+            if len(pending) >= 2 * max(jobs, 1):
+                yield collect_probe(*pending.popleft())
+
+        while pending:
+            yield collect_probe(*pending.popleft())
+
+
+def collect_probe(file_path, future):
+    try:
+        return file_path, future.result(), None
+    except Exception as e:
+        return file_path, None, e
+
+
+def report_probe_error(file_path, error):
+    if isinstance(error, FileNotFoundError) and error.filename == "ffprobe":
         print(
             "⚠️ ffprobe not found. Please ensure ffmpeg is installed and ffprobe is in your PATH."
         )
-        return None
-    except Exception as e:
-        print(f"⚠️ Error processing file {file_path}: {e}")
-        return None
+    elif isinstance(error, OSError):
+        print(f"⚠️ Can't read file {file_path}: {error.strerror}")
+    elif isinstance(error, subprocess.TimeoutExpired):
+        print(f"⚠️ Timed out probing file {file_path} after {error.timeout}s")
+    else:
+        print(f"⚠️ Error processing file {file_path}: {error}")
+
+
+def probe_file(file_path, timeout=None):
+    stat = file_path.stat()
+    file_info = {
+        "filepath": str(file_path),
+        "filename": file_path.name,
+        "file_extension": file_path.suffix,
+        "file_size": stat.st_size,
+        "file_mtime_ns": stat.st_mtime_ns,
+        "video_codec": None,
+        "video_resolution": None,
+        "duration": None,
+        "bit_rate": None,
+        "fingerprint": fingerprint_file(file_path),
+        "audio_channels": [],
+        "subtitle_channels": [],
+    }
+
+    # Run ffprobe to get detailed information about the file
+    result = subprocess.run(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-print_format",
+            "json",
+            "-show_streams",
+            "-show_format",
+            str(file_path),
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        timeout=timeout,
+    )
+    ffprobe_output = json.loads(result.stdout)
+
+    # Duration and bit rate feed the server's transcode priority estimate
+    file_format = ffprobe_output.get("format", {})
+    if "duration" in file_format:
+        file_info["duration"] = float(file_format["duration"])
+    if "bit_rate" in file_format:
+        file_info["bit_rate"] = int(file_format["bit_rate"])
+
+    for stream in ffprobe_output.get("streams", []):
+        if stream["codec_type"] == "video":
+            file_info["video_codec"] = stream.get("codec_name")
+            file_info["video_resolution"] = (
+                f"{stream.get('width')}x{stream.get('height')}"
+            )
+        elif stream["codec_type"] == "audio":
+            audio_channel = {
+                "name": stream.get("tags", {}).get("title", "unknown"),
+                "channel": stream.get("tags", {}).get("language", "unknown"),
+                "codec": stream.get("codec_name") or "unknown",
+            }
+            file_info["audio_channels"].append(audio_channel)
+        elif stream["codec_type"] == "subtitle":
+            subtitle_channel = {
+                "name": stream.get("tags", {}).get("title", "unknown"),
+                "subtitle": stream.get("tags", {}).get("language", "unknown"),
+                "codec": stream.get("codec_name") or "unknown",
+            }
+            file_info["subtitle_channels"].append(subtitle_channel)
 
     return file_info
 
 
-def send_file_info_to_server(file_info, server_url):
-    response = requests.post(f"{server_url}/files/", json=file_info)
+def send_files_info_to_server(http, files_info, server_url):
+    """Upload a batch, returning the server's result for each file, or None"""
+    response = http.post(f"{server_url}/files/bulk", json=files_info)
     if response.status_code == 200:
-        print(f"✅ Successfully uploaded: {file_info['filename']}")
-    else:
+        results = response.json()
+        statuses = Counter(result["status"] for result in results)
         print(
-            f"❌ Failed to upload: {file_info['filename']}. Status code: {response.status_code}, Response: {response.text}"
+            f"✅ Successfully uploaded {len(files_info) - statuses['invalid']} files "
+            f"({statuses['inserted']} inserted, {statuses['updated']} updated, {statuses['moved']} moved, {statuses['unchanged']} unchanged)"
+        )
+        for file_info, result in zip(files_info, results):
+            if result["status"] == "invalid":
+                print(f"⚠️ Rejected {file_info['filepath']}: {result['error']}")
+        return results
+
+    filenames = ", ".join(file_info["filename"] for file_info in files_info)
+    print(
+        f"❌ Failed to upload: {filenames}. Status code: {response.status_code}, Response: {response.text}"
+    )
+    return None
+
+
+# ========== Watcher ==========
+
+
+# From linux/inotify.h
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+INOTIFY_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+)
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """Recursive inotify watch on a directory tree, yielding (kind, path) events.
+
+    `kind` is "changed" for files and directories that appeared or were
+    written to, and "deleted" for those removed or moved away.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError("inotify is not supported on this platform")
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+        try:
+            self.add_tree(self.root)
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def close(self):
+        os.close(self.fd)
+
+    def add_tree(self, root):
+        for directory, _, _ in os.walk(root):
+            wd = self.libc.inotify_add_watch(
+                self.fd, os.fsencode(directory), INOTIFY_MASK
+            )
+            if wd < 0:
+                # ENOSPC here means fs.inotify.max_user_watches is too low
+                errno = ctypes.get_errno()
+                raise OSError(errno, f"Can't watch {directory}: {os.strerror(errno)}")
+            self.watches[wd] = Path(directory)
+
+    def remove_tree(self, root):
+        for wd, directory in list(self.watches.items()):
+            if directory == root or directory.is_relative_to(root):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.watches[wd]
+
+    def events(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[
+                offset + INOTIFY_EVENT.size : offset + INOTIFY_EVENT.size + length
+            ]
+            offset += INOTIFY_EVENT.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped, so go over the whole tree again
+                events.append(("changed", self.root))
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            if wd not in self.watches:
+                continue
+
+            path = self.watches[wd] / os.fsdecode(name.rstrip(b"\0"))
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                if mask & IN_ISDIR:
+                    self.remove_tree(path)
+                events.append(("deleted", path))
+            else:
+                if mask & IN_ISDIR:
+                    self.add_tree(path)
+                events.append(("changed", path))
+        return events
+
+
+class PollingWatcher:
+    """Fallback for InotifyWatcher that compares walks of the tree every `interval`.
+
+    A change is only reported once two walks in a row agree on it, so files
+    that are still being written are left alone, and a renamed file's old
+    and new paths are reported together.
+    """
+
+    def __init__(self, root, interval):
+        self.root = root
+        self.interval = interval
+        self.last_walk = self.walk()
+        self.reported = dict(self.last_walk)
+        self.next_walk = time.monotonic() + interval
+
+    def close(self):
+        pass
+
+    def walk(self):
+        files = {}
+        for file_path in iter_media_files(self.root):
+            try:
+                stat = file_path.stat()
+            except FileNotFoundError:
+                continue
+            files[file_path] = (stat.st_size, stat.st_mtime_ns)
+        return files
+
+    def events(self, timeout):
+        wait = self.next_walk - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(wait, 0))
+        self.next_walk = time.monotonic() + self.interval
+
+        files = self.walk()
+        events = [
+            ("deleted", file_path)
+            for file_path in self.reported
+            if file_path not in files and file_path not in self.last_walk
+        ]
+        for file_path, state in files.items():
+            if self.last_walk.get(file_path) == state != self.reported.get(file_path):
+                events.append(("changed", file_path))
+        self.reported = {
+            file_path: state
+            for file_path, state in self.reported.items()
+            if file_path in files or file_path in self.last_walk
+        }
+        self.reported.update(
+            (file_path, files[file_path])
+            for kind, file_path in events
+            if kind == "changed"
+        )
+        self.last_walk = files
+        return events
+
+
+def start_inotify(path):
+    try:
+        watcher = InotifyWatcher(path)
+    except OSError as e:
+        print(f"⚠️ Can't use inotify ({e}), falling back to polling")
+        return None
+    print(f"👀 Watching {path} for changes")
+    return watcher
+
+
+def watch_library(path, watcher, cache, http, server_url, jobs, probe_timeout, settle):
+    """Keep the catalog in step with `path` as files are added, changed or removed.
+
+    Files are catalogued once they've gone `settle` seconds without changing.
+    Changes the server couldn't take are kept pending and retried.
+    """
+    import requests
+
+    # Path -> (kind, when it last changed). Deletions wait too, so that the
+    # new path of a renamed file can reuse the probe results cached for the old one.
+    pending = {}
+    try:
+        while True:
+            for kind, event_path in watcher.events(timeout=1):
+                if kind == "changed" and event_path.is_dir():
+                    for file_path in iter_media_files(event_path):
+                        pending[file_path] = (kind, time.monotonic())
+                else:
+                    pending[event_path] = (kind, time.monotonic())
+
+            now = time.monotonic()
+            settled = [
+                (kind, event_path)
+                for event_path, (kind, changed_at) in pending.items()
+                if now - changed_at >= settle
+            ]
+            for _, event_path in settled:
+                del pending[event_path]
+
+            changed = [
+                event_path
+                for kind, event_path in settled
+                if kind == "changed" and is_media_file(event_path)
+            ]
+            deleted = [event_path for kind, event_path in settled if kind == "deleted"]
+            for kind, paths, flush in (
+                ("changed", changed, catalog_changed_files),
+                ("deleted", deleted, remove_deleted_files),
+            ):
+                if not paths:
+                    continue
+                try:
+                    flushed = flush(paths, cache, http, server_url, jobs, probe_timeout)
+                except requests.RequestException as e:
+                    print(f"⚠️ Failed to update the catalog, will retry: {e}")
+                    flushed = False
+                if not flushed:
+                    for event_path in paths:
+                        pending.setdefault(event_path, (kind, time.monotonic()))
+    except KeyboardInterrupt:
+        print(f"🛑 Stopped watching {path}")
+    finally:
+        watcher.close()
+
+
+def catalog_changed_files(file_paths, cache, http, server_url, jobs, probe_timeout):
+    """Catalog changed files, returning False if the server didn't take them"""
+    files = []
+    stats = {}
+    for file_path in file_paths:
+        try:
+            stat = file_path.stat()
+        except FileNotFoundError:
+            continue
+        if cache.is_fresh(file_path, stat):
+            continue
+
+        try:
+            file_info = find_cached_probe(cache, file_path, stat)
+        except OSError as e:
+            report_probe_error(file_path, e)
+            continue
+        if file_info is not None:
+            files.append((file_path, stat, file_info))
+        else:
+            stats[file_path] = stat
+
+    for file_path, file_info, error in probe_files(
+        stats, jobs=jobs, timeout=probe_timeout
+    ):
+        if error is not None:
+            report_probe_error(file_path, error)
+            continue
+        files.append((file_path, stats[file_path], file_info))
+
+    if not files:
+        return True
+    results = send_files_info_to_server(
+        http, [file_info for _, _, file_info in files], server_url
+    )
+    if results is None:
+        return False
+    cache_sent_files(cache, files, results)
+    cache.commit()
+    return True
+
+
+def remove_deleted_files(paths, cache, http, server_url, jobs=None, probe_timeout=None):
+    """Remove deleted files, and every file under deleted directories, from the catalog.
+
+    Returns False if the server didn't remove them. `jobs` and `probe_timeout`
+    are unused, to match catalog_changed_files.
+    """
+    filepaths = []
+    for path in paths:
+        filepaths.extend(cache.paths_under(path))
+        if is_media_file(path):
+            filepaths.append(str(path))
+    if not filepaths:
+        return True
+
+    response = http.delete(f"{server_url}/files/", json={"filepaths": filepaths})
+    if response.status_code == 200:
+        print(f"🗑️ Removed {response.json()['deleted']} deleted files from the catalog")
+        cache.remove(filepaths)
+        return True
+    print(
+        f"❌ Failed to remove deleted files. Status code: {response.status_code}, Response: {response.text}"
+    )
+    return False
+
+
+# ========== Catalog snapshot ==========
+
+
+class CatalogSnapshot:
+    """Local SQLite copy of the catalog, kept current through GET /files/changes"""
+
+    page_size = 5000
+
+    def __init__(self, path=snapshot_path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS file (
+                id INTEGER PRIMARY KEY,
+                revision INTEGER NOT NULL,
+                file_size INTEGER NOT NULL,
+                file_info TEXT NOT NULL
+            )
+            """
         )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS file_size ON file (file_size)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.connection.close()
+
+    def get_meta(self, key, default=None):
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value))
+        )
+
+    def clear(self):
+        self.connection.execute("DELETE FROM file")
+        self.connection.execute("DELETE FROM meta")
+
+    def sync(self, server_url):
+        """Fetch what changed since the last sync, returning (changed, deleted) counts.
+
+        The snapshot is replaced when it came from another server or catalog.
+        Nothing is committed until the whole feed is read, so an interrupted
+        sync leaves the previous snapshot intact.
+        """
+        import requests
+
+        if self.get_meta("server_url") != server_url:
+            self.clear()
+        since = int(self.get_meta("revision", 0))
+        changed = deleted = 0
+        with requests.Session() as http:
+            params = {"since": since, "limit": self.page_size, "fast": True}
+            first_page = True
+            while True:
+                response = http.get(f"{server_url}/files/changes", params=params)
+                response.raise_for_status()
+                page = response.json()
+
+                if first_page:
+                    if since and (
+                        page["catalog_id"] != self.get_meta("catalog_id")
+                        or page["revision"] < since
+                    ):
+                        # The server's database was replaced; start over
+                        self.clear()
+                        since = params["since"] = 0
+                        continue
+                    first_page = False
+                    revision = page["revision"]
+                    # A tombstone only removes files last changed before it
+                    deleted = self.connection.executemany(
+                        "DELETE FROM file WHERE id = ? AND revision < ?",
+                        [(row["file_id"], row["revision"]) for row in page["deleted"]],
+                    ).rowcount
+
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO file VALUES (?, ?, ?, ?)",
+                    [
+                        (
+                            file["id"],
+                            file["revision"],
+                            file["file_size"],
+                            json.dumps(file),
+                        )
+                        for file in page["files"]
+                    ],
+                )
+                changed += len(page["files"])
+                if page["complete"]:
+                    break
+                params["since"] = page["files"][-1]["revision"]
+                params["after_id"] = page["files"][-1]["id"]
+
+        self.set_meta("server_url", server_url)
+        self.set_meta("catalog_id", page["catalog_id"])
+        self.set_meta("revision", revision)
+        self.connection.commit()
+        return changed, deleted
+
+    def files(self, min_size=0):
+        for (file_info,) in self.connection.execute(
+            "SELECT file_info FROM file WHERE file_size >= ?", (min_size,)
+        ):
+            yield json.loads(file_info)
+
+    def max_file_size(self):
+        return self.connection.execute("SELECT max(file_size) FROM file").fetchone()[0]
+
+
+def synced_snapshot(server_url):
+    """The local catalog snapshot, brought up to date with the server"""
+    snapshot = CatalogSnapshot()
+    snapshot.sync(server_url)
+    return snapshot
+
+
+@app.command()
+def sync(server_url: str | None = None):
+    """Bring the local catalog snapshot up to date with the server"""
+    if server_url is None:
+        server_url = get("server_url")
+
+    with CatalogSnapshot() as snapshot:
+        changed, deleted = snapshot.sync(server_url)
+        revision = snapshot.get_meta("revision")
+    print(
+        f"🔄 Synced catalog to revision {revision}: {changed} changed, {deleted} deleted"
+    )
 
 
 # ========== Stats ==========
 
 
-def get_files(base_url):
-    response = requests.get(f"{base_url}/files?limit=10000")
+def get_stats(base_url):
+    import requests
+
+    response = requests.get(f"{base_url}/files/stats")
     response.raise_for_status()
     return response.json()
 
@@ -163,10 +1004,16 @@ def large(server_url: str | None = None):
     if server_url is None:
         server_url = get("server_url")
 
-    files = get_files(server_url)
+    with synced_snapshot(server_url) as snapshot:
+        largest_size = snapshot.max_file_size()
+        if largest_size is None:
+            print("\nNo files in the catalog")
+            return
 
-    # Sort files by size
-    sorted_files = sorted(files, key=lambda x: x["file_size"], reverse=True)
+        # Only load the files within 1GB of the largest
+        gb_in_bytes = 1024 * 1024 * 1024
+        files = snapshot.files(min_size=largest_size - gb_in_bytes)
+        sorted_files = sorted(files, key=lambda x: x["file_size"], reverse=True)
 
     # Get the largest file
     largest_file = sorted_files[0]
@@ -174,13 +1021,7 @@ def large(server_url: str | None = None):
         f"\n📦 Largest file: {largest_file['filename']} ({human_readable_size(largest_file['file_size'])})"
     )
 
-    # Find files within 1GB of the largest
-    gb_in_bytes = 1024 * 1024 * 1024
-    similar_size_files = [
-        f
-        for f in sorted_files[1:]
-        if abs(f["file_size"] - largest_file["file_size"]) <= gb_in_bytes
-    ]
+    similar_size_files = sorted_files[1:]
 
     if similar_size_files:
         print("\n📋 Files within 1GB of largest:")
@@ -190,24 +1031,32 @@ def large(server_url: str | None = None):
         print("\nNo other files within 1GB of largest file")
 
 
+def print_histogram(counts, total):
+    from rich.progress import Progress
+
+    with Progress() as progress:
+        for name, count in counts.items():
+            progress.add_task(f"[cyan]{name}", total=total, completed=count)
+
+
 @app.command()
 def stats(server_url: str | None = None):
+    from rich.progress import Progress
+
     if server_url is None:
         server_url = get("server_url")
 
-    files = get_files(server_url)
-    total_files = len(files)
-    total_size = sum(file["file_size"] for file in files)
+    catalog_stats = get_stats(server_url)
+    total_files = catalog_stats["total_files"]
 
     print("📊 ==== File Stats ====")
     print(f"📁 Total files scanned: {total_files}")
-    print(f"💾 Total size of all files: {human_readable_size(total_size)}")
+    print(
+        f"💾 Total size of all files: {human_readable_size(catalog_stats['total_size'])}"
+    )
 
     # Calculate the proportion of files needing transcoding
-    files_needing_transcoding = filter_files(files)
-    percent_needing_transcoding = round(
-        (len(files_needing_transcoding) / total_files) * 100
-    )
+    percent_needing_transcoding = round(catalog_stats["transcode_fraction"] * 100)
 
     with Progress() as progress:
         progress.add_task(
@@ -216,44 +1065,51 @@ def stats(server_url: str | None = None):
             completed=percent_needing_transcoding,
         )
 
-    # Calculate the proportion of video codecs
     print("\n🎥 ==== Video Codecs ====")
-    codec_counts = {}
-    for file in files:
-        codec = file["video_codec"]
-        if codec:
-            codec_counts[codec] = codec_counts.get(codec, 0) + 1
+    print_histogram(catalog_stats["video_codecs"], total_files)
 
-    # Display progress bars for video codecs
-    with Progress() as progress:
-        for codec, count in codec_counts.items():
-            progress.add_task(f"[cyan]{codec}", total=total_files, completed=count)
+    print("\n📺 ==== Resolutions ====")
+    print_histogram(catalog_stats["resolutions"], total_files)
 
     print("\n🔊 ==== Audio Codecs ====")
-    audio_codec_counts = {}
-    for file in files:
-        for audio_channel in file["audio_channels"]:
-            codec = audio_channel["codec"]
-            audio_codec_counts[codec] = audio_codec_counts.get(codec, 0) + 1
+    audio_codecs = catalog_stats["audio_codecs"]
+    print_histogram(audio_codecs, sum(audio_codecs.values()))
 
-    total_audios = sum(audio_codec_counts.values())
+    print("\n💬 ==== Subtitle Codecs ====")
+    subtitle_codecs = catalog_stats["subtitle_codecs"]
+    print_histogram(subtitle_codecs, sum(subtitle_codecs.values()))
 
-    with Progress() as progress:
-        for codec, count in audio_codec_counts.items():
-            progress.add_task(f"[cyan]{codec}", total=total_audios, completed=count)
 
-    print("\n💬 ==== Subtitle Codecs ====")
-    subtitle_codec_counts = {}
-    for file in files:
-        for subtitle_channel in file["subtitle_channels"]:
-            codec = subtitle_channel["codec"]
-            subtitle_codec_counts[codec] = subtitle_codec_counts.get(codec, 0) + 1
+def get_duplicates(base_url, limit):
+    import requests
 
-    total_subtitles = sum(subtitle_codec_counts.values())
+    response = requests.get(f"{base_url}/files/duplicates", params={"limit": limit})
+    response.raise_for_status()
+    return response.json()
 
-    with Progress() as progress:
-        for codec, count in subtitle_codec_counts.items():
-            progress.add_task(f"[cyan]{codec}", total=total_subtitles, completed=count)
+
+@app.command()
+def duplicates(server_url: str | None = None, limit: int = 100):
+    """List files with identical content, largest savings first"""
+    if server_url is None:
+        server_url = get("server_url")
+
+    groups = get_duplicates(server_url, limit)
+    if not groups:
+        print("✅ No duplicate files found")
+        return
+
+    print(f"👯 ==== {len(groups)} groups of duplicate files ====")
+    for group in groups:
+        print(
+            f"\n📦 {len(group['filepaths'])} copies of {human_readable_size(group['file_size'])}, "
+            f"{human_readable_size(group['reclaimable'])} reclaimable:"
+        )
+        for filepath in group["filepaths"]:
+            print(f"- {filepath}")
+
+    reclaimable = sum(group["reclaimable"] for group in groups)
+    print(f"\n💾 Total reclaimable: {human_readable_size(reclaimable)}")
 
 
 # ========== Problems ==========
@@ -264,48 +1120,216 @@ def problems(server_url: str | None = None):
     if server_url is None:
         server_url = get("server_url")
 
-    files = get_files(server_url)
     pgs_files = []
-    for file in files:
-        if any(
-            [sub["codec"] == "hdmv_pgs_subtitle" for sub in file["subtitle_channels"]]
-        ):
-            pgs_files.append(file)
+    with synced_snapshot(server_url) as snapshot:
+        for file in snapshot.files():
+            if any(
+                [
+                    sub["codec"] == "hdmv_pgs_subtitle"
+                    for sub in file["subtitle_channels"]
+                ]
+            ):
+                pgs_files.append(file)
 
     print(f"\n⚠️ Found {len(pgs_files)} files with PGS subtitles:")
     for file in pgs_files:
         print(file_to_string(file))
 
 
+# ========== Journal ==========
+
+
+# Steps of a transcode job, in order; a job is finished once its catalog entry is updated
+JOURNAL_STATES = (
+    "started",
+    "copied",
+    "encoded",
+    "original_moved",
+    "output_placed",
+    "catalog_updated",
+)
+JOURNAL_FINAL_STATES = {"catalog_updated", "rolled_back"}
+
+
+class Journal:
+    """Append-only JSONL log of transcode job steps, fsync'd as each step completes.
+
+    Entries are keyed by the original file path. Only one process may use the
+    journal at a time, so a run never resumes jobs another run is working on.
+    """
+
+    def __init__(self, path=journal_path):
+        self.path = path
+        self.lock_file = open(path.with_suffix(".lock"), "w")
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print(f"⚠️ Another jellyfier process is using the journal at {path}")
+            raise typer.Exit(1)
+
+        self.entries = {}
+        if path.exists():
+            with open(path) as journal_file:
+                for line in journal_file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Torn write from a crash
+                    self.entries.setdefault(entry["file"], {}).update(entry)
+        self.compact()
+        self.lock = threading.Lock()
+        self.file = open(path, "a")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.file.close()
+        self.compact()
+        self.lock_file.close()
+
+    def record(self, job, state):
+        job["state"] = state
+        entry = {"file": str(job["file"]), "state": state}
+        if state == "started":
+            entry.update(
+                o_file=job["o_file"],
+                # Kept so a resumed job encodes the same way without the server
+                plan=job["plan"],
+                copy_strategy=job["copy_strategy"],
+                temp_file=str(job["temp_file"]),
+                temp_transcoded_file=str(job["temp_transcoded_file"]),
+                server_job_id=job["server_job_id"],
+            )
+        with self.lock:
+            self.entries.setdefault(entry["file"], {}).update(entry)
+            self.file.write(json.dumps(entry) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def incomplete(self):
+        """Jobs that were interrupted, rebuilt from their journal entries"""
+        return [
+            job_from_entry(entry)
+            for entry in self.entries.values()
+            if entry["state"] not in JOURNAL_FINAL_STATES
+        ]
+
+    def compact(self):
+        """Rewrite the journal with only the entries of unfinished jobs"""
+        self.entries = {
+            file: entry
+            for file, entry in self.entries.items()
+            if entry["state"] not in JOURNAL_FINAL_STATES
+        }
+        compacted_path = self.path.with_suffix(".tmp")
+        with open(compacted_path, "w") as compacted_file:
+            for entry in self.entries.values():
+                compacted_file.write(json.dumps(entry) + "\n")
+            compacted_file.flush()
+            os.fsync(compacted_file.fileno())
+        os.replace(compacted_path, self.path)
+
+
+def job_from_entry(entry):
+    job = new_job(entry["o_file"], entry["plan"], CopyStrategy(entry["copy_strategy"]))
+    job["temp_file"] = Path(entry["temp_file"])
+    job["temp_transcoded_file"] = Path(entry["temp_transcoded_file"])
+    job["server_job_id"] = entry.get("server_job_id")
+    job["state"] = entry["state"]
+
+    # Fall back to the last step whose output survived, e.g. if /tmp was wiped
+    if job["state"] == "encoded" and not job["temp_transcoded_file"].exists():
+        job["state"] = "copied"
+    if job["state"] == "copied" and not job["temp_file"].exists():
+        job["state"] = "started"
+    return job
+
+
+def reached(job, state):
+    return job["state"] in JOURNAL_STATES and JOURNAL_STATES.index(
+        job["state"]
+    ) >= JOURNAL_STATES.index(state)
+
+
+def can_resume(job):
+    # Once the original is moved aside, only the encoded output can finish the job
+    return not reached(job, "original_moved") or (
+        reached(job, "output_placed") or staged_output_path(job["file"]).exists()
+    )
+
+
+def rollback_job(job, journal):
+    """Undo an interrupted job, putting the original back where it was"""
+    file = job["file"]
+    old_file = file.with_suffix(f"{file.suffix}.old")
+    transcoded_file = file.with_suffix(job["temp_transcoded_file"].suffix)
+
+    # The original may have been renamed without the journal hearing about it
+    if old_file.exists() and (reached(job, "original_moved") or not file.exists()):
+        print(f"🔄 Restoring [blue]{old_file}[/blue] to [blue]{file}[/blue]")
+        transcoded_file.unlink(missing_ok=True)
+        old_file.rename(file)
+    elif not file.exists() or reached(job, "output_placed"):
+        print(
+            f"⚠️ Can't roll back [blue]{file}[/blue], the original is gone; resume it instead"
+        )
+        return False
+
+    if job["temp_file"] != file:
+        job["temp_file"].unlink(missing_ok=True)
+    job["temp_transcoded_file"].unlink(missing_ok=True)
+    staged_output_path(file).unlink(missing_ok=True)
+    if job["state"] is not None:
+        journal.record(job, "rolled_back")
+    return True
+
+
+def recover_jobs(journal, resume):
+    """Roll back interrupted jobs, returning those to resume if `resume` is set"""
+    resumable = []
+    for job in journal.incomplete():
+        if resume and can_resume(job):
+            print(f"⏩ Resuming [blue]{job['file']}[/blue] after step {job['state']}")
+            resumable.append(job)
+        else:
+            rollback_job(job, journal)
+    return resumable
+
+
 # ========== Transcoder ==========
 
 
-def filter_files(files):
-    filtered_files = []
-    for file in files:
-        if any(
-            [sub["codec"] == "hdmv_pgs_subtitle" for sub in file["subtitle_channels"]]
-        ):
-            continue
+# Field of a candidate that the server's keyset cursor continues from, per ordering
+CANDIDATE_CURSOR_FIELDS = {"size": "file_size", "priority": "priority"}
 
-        if file["video_codec"] != "h264":
-            filtered_files.append(file)
-            continue
 
-        if len(file["audio_channels"]) > 0 and not all(
-            audio["codec"] in ["aac", "flac"] for audio in file["audio_channels"]
-        ):
-            filtered_files.append(file)
-            continue
+def get_candidates(base_url, count=0, order_by="priority"):
+    """Yield files needing transcoding as selected by the server, `count` at most (0 for all)"""
+    import requests
 
-        if len(file["subtitle_channels"]) > 0 and not all(
-            subtitle["codec"] in ["srt", "ass", "subrip"]
-            for subtitle in file["subtitle_channels"]
-        ):
-            filtered_files.append(file)
-            continue
+    page_size = count or 500
+    params = {"limit": page_size, "order_by": order_by, "fast": True}
+    while True:
+        response = requests.get(f"{base_url}/files/candidates", params=params)
+        response.raise_for_status()
+        page = response.json()
+        yield from page
+
+        if count or len(page) < page_size:
+            return
+        params["after_id"] = page[-1]["id"]
+        if order_by in CANDIDATE_CURSOR_FIELDS:
+            params["after_value"] = page[-1][CANDIDATE_CURSOR_FIELDS[order_by]]
 
-    return filtered_files
+
+def get_compatible_codecs(base_url):
+    """Codecs Jellyfin can direct play, per stream type, as the server judges candidates"""
+    import requests
+
+    response = requests.get(f"{base_url}/files/codecs")
+    response.raise_for_status()
+    return {kind: frozenset(codecs) for kind, codecs in response.json().items()}
 
 
 def file_to_string(file):
@@ -319,224 +1343,810 @@ def file_to_string(file):
     return f"{file['id']}. {file['filename']} - {file['video_codec']}{' - ' if audio_str != '' else ''}{audio_str}{' - ' if subtitle_str != '' else ''}{subtitle_str}"
 
 
-def transcode_file(file):
-    """Runs ffmpeg -i input.mkv -c:v libx264 -pix_fmt yuv420p -c:a aac -c:s srt output.mkv"""
-    output_file = file.with_suffix(".jellyfied.mkv")
+def plan_transcode(file, codecs):
+    """Decide per stream whether it can be copied or has to be re-encoded.
 
-    print(f"🎬 Transcoding {file}")
+    `codecs` are the compatible codecs from get_compatible_codecs.
+    """
+    return {
+        "video": "copy" if file["video_codec"] in codecs["video"] else "libx264",
+        "audio": [
+            "copy" if audio["codec"] in codecs["audio"] else "aac"
+            for audio in file["audio_channels"]
+        ],
+        "subtitle": [
+            "copy" if subtitle["codec"] in codecs["subtitle"] else "srt"
+            for subtitle in file["subtitle_channels"]
+        ],
+    }
+
+
+def plan_to_string(plan):
+    parts = [f"video: {plan['video']}"]
+    if plan["audio"]:
+        parts.append(f"audio: {', '.join(plan['audio'])}")
+    if plan["subtitle"]:
+        parts.append(f"subtitles: {', '.join(plan['subtitle'])}")
+    return " | ".join(parts)
+
+
+def plan_to_arguments(plan):
+    # Copy everything by default, then override the streams that need work
+    arguments = ["-c", "copy"]
+    if plan["video"] != "copy":
+        arguments += ["-c:v", plan["video"], "-pix_fmt", "yuv420p"]
+    for index, codec in enumerate(plan["audio"]):
+        if codec != "copy":
+            arguments += [f"-c:a:{index}", codec]
+    for index, codec in enumerate(plan["subtitle"]):
+        if codec != "copy":
+            arguments += [f"-c:s:{index}", codec]
+    return arguments
+
+
+# ffmpeg is killed once it reports no progress for STALL_TIMEOUT seconds, or for
+# STALL_GAP_FACTOR times the longest gap between its reports so far if longer
+STALL_TIMEOUT = 300
+STALL_GAP_FACTOR = 10
+# Lines of ffmpeg's stderr kept to explain a failure
+STDERR_TAIL_LINES = 40
+
+
+class StallWatchdog:
+    """Kills a process that stops making progress, or terminates it on cancel"""
+
+    def __init__(self, process, cancel=None):
+        self.process = process
+        self.cancel = cancel
+        self.last_progress = time.monotonic()
+        # The wait before the first report includes probing the input, so skip it
+        self.longest_gap = None
+        self.stalled = False
+        self.finished = threading.Event()
+        threading.Thread(target=self.watch, daemon=True).start()
+
+    def kick(self):
+        now = time.monotonic()
+        if self.longest_gap is not None:
+            self.longest_gap = max(self.longest_gap, now - self.last_progress)
+        else:
+            self.longest_gap = 0
+        self.last_progress = now
+
+    def limit(self):
+        return max(STALL_TIMEOUT, STALL_GAP_FACTOR * (self.longest_gap or 0))
+
+    def watch(self):
+        while not self.finished.wait(timeout=1):
+            if self.cancel is not None and self.cancel.is_set():
+                self.process.terminate()
+                return
+            if time.monotonic() - self.last_progress > self.limit():
+                self.stalled = True
+                self.process.kill()
+                return
+
+    def stop(self):
+        self.finished.set()
+
+
+def transcode_file(file, output_file, plan, duration=None, progress=None, cancel=None):
+    """Runs ffmpeg -i input.mkv -map 0 -c copy <per-stream overrides> output.mkv
+
+    Progress is read from ffmpeg's -progress stream to drive a per-file bar,
+    with an ETA when the duration is known.
+    """
+    print(f"🎬 Transcoding {file} ({plan_to_string(plan)})")
 
     command = [
         "ffmpeg",
+        "-y",
+        "-nostats",
+        "-progress",
+        "pipe:1",
         "-i",
         file,
         "-map",
         "0",
-        "-c:v",
-        "libx264",
-        "-pix_fmt",
-        "yuv420p",
-        "-c:a",
-        "aac",
-        "-c:s",
-        "srt",
+        *plan_to_arguments(plan),
         output_file,
     ]
 
-    result = subprocess.run(
-        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=3600
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
     )
+    stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+    stderr_reader = threading.Thread(
+        target=stderr_tail.extend, args=(process.stderr,), daemon=True
+    )
+    stderr_reader.start()
+    watchdog = StallWatchdog(process, cancel)
+
+    task = None
+    if progress is not None:
+        task = progress.add_task(f"[magenta]{file.name}", total=duration)
+
+    # Reports are blocks of key=value lines, each ending with a progress= line
+    report = {}
+    for line in process.stdout:
+        key, _, value = line.strip().partition("=")
+        report[key] = value
+        if key != "progress":
+            continue
+
+        watchdog.kick()
+        if task is not None:
+            out_time_us = report.get("out_time_us", "N/A")
+            progress.update(
+                task,
+                completed=int(out_time_us) / 1_000_000
+                if out_time_us.lstrip("-").isdigit()
+                else None,
+                description=f"[magenta]{file.name}[/magenta] {report.get('speed', '?')} {report.get('fps', '?')} fps",
+            )
+        report = {}
+
+    returncode = process.wait()
+    watchdog.stop()
+    stderr_reader.join()
+    if task is not None:
+        progress.remove_task(task)
 
-    if result.returncode == 0:
+    if returncode == 0:
         print(f"✅ Transcoded {file} to {output_file}")
-    else:
-        print(f"❌ Failed to transcode {file}: {result.stderr}")
+        return True
 
+    if watchdog.stalled:
+        print(f"❌ Killed ffmpeg on {file}: no progress for {watchdog.limit():.0f}s")
+    elif cancel is None or not cancel.is_set():
+        print(f"❌ Failed to transcode {file}: {''.join(stderr_tail)}")
+    return False
 
-def delete_file(file, server_url):
-    response = requests.delete(f"{server_url}/files/{file['id']}")
-    if response.status_code == 200:
-        print(f"🗑️ Successfully deleted: {file['filename']}")
-    else:
-        print(
-            f"❌ Failed to delete: {file['filename']}. Status code: {response.status_code}, Response: {response.text}"
+
+class CopyStrategy(str, Enum):
+    # Copy the source to /tmp, encode there and copy the output back
+    tmp = "tmp"
+    # Read the source where it is and write the output next to it
+    in_place = "in-place"
+
+
+def staged_output_path(file):
+    """Hidden file next to `file` that output is written to before being renamed over"""
+    return file.with_name(f".{file.stem}.jellyfied.mkv")
+
+
+def check_free_space(directory, needed):
+    free = shutil.disk_usage(directory).free
+    if free < needed:
+        raise OSError(
+            f"Not enough free space in {directory}: {human_readable_size(needed)} needed, {human_readable_size(free)} free"
         )
 
 
+# From linux/fs.h, shares the source's extents on filesystems like Btrfs and XFS
+FICLONE = 0x40049409
+
+
+def copy_file(source, destination):
+    """Copy a file as cheaply as the filesystems allow.
+
+    Tries a reflink first, which copies no data at all, then copy_file_range,
+    which copies inside the kernel (or server-side on NFS/SMB), and finally
+    falls back to a plain buffered copy. Both fast paths are Linux-only.
+    """
+    with open(source, "rb") as source_file, open(destination, "wb") as target_file:
+        try:
+            fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+        except OSError:
+            size = os.fstat(source_file.fileno()).st_size
+            try:
+                if not hasattr(os, "copy_file_range"):
+                    raise OSError("copy_file_range is not available")
+                while copied := os.copy_file_range(
+                    source_file.fileno(), target_file.fileno(), size
+                ):
+                    size -= copied
+            except OSError:
+                source_file.seek(0)
+                target_file.seek(0)
+                target_file.truncate()
+                shutil.copyfileobj(source_file, target_file, 1024 * 1024)
+    shutil.copymode(source, destination)
+
+
+def delete_files(server_url, **file_filter):
+    """Delete the catalog entries matching `file_filter` in a single request"""
+    import requests
+
+    response = requests.delete(f"{server_url}/files/", json=file_filter)
+    if response.status_code == 200:
+        print(f"🗑️ Successfully deleted {response.json()['deleted']} files")
+        return True
+    print(
+        f"❌ Failed to delete files. Status code: {response.status_code}, Response: {response.text}"
+    )
+    return False
+
+
 @app.command()
 def transcode(
-    server_url: str | None = None, count: int = 1, delete_after: bool = False
+    server_url: str | None = None,
+    count: int = 1,
+    order_by: str = "priority",
+    workers: int = 1,
+    delete_after: bool = False,
+    copy_strategy: CopyStrategy = CopyStrategy.tmp,
 ):
     if server_url is None:
         server_url = get("server_url")
 
-    files = get_files(server_url)
-    filtered_files = filter_files(files)
+    with Journal() as journal:
+        resumed = []
+        if journal.incomplete():
+            print(f"⚠️ Found {len(journal.incomplete())} interrupted transcodes")
+            resumed = recover_jobs(
+                journal, typer.confirm("Resume them? Otherwise they are rolled back")
+            )
+        resumed_paths = {str(job["file"]) for job in resumed}
 
-    if count == 0:
-        files_to_transcode = filtered_files
-    else:
-        files_to_transcode = filtered_files[:count]
+        codecs = get_compatible_codecs(server_url)
+        files_to_transcode = [
+            (file, plan_transcode(file, codecs))
+            for file in get_candidates(server_url, count, order_by)
+            if file["filepath"] not in resumed_paths
+        ]
 
-    print(f"⚙️ You are about to transcode {len(files_to_transcode)} files")
-    for file in files_to_transcode:
-        print(file_to_string(file))
+        print(f"⚙️ You are about to transcode {len(files_to_transcode)} files")
+        for file, plan in files_to_transcode:
+            print(file_to_string(file))
+            print(f"   ↳ {plan_to_string(plan)}")
 
-    if typer.confirm("Do you want to continue?"):
-        total_files = len(files_to_transcode)
-        threads = []
+        if not typer.confirm("Do you want to continue?"):
+            files_to_transcode = []
 
-        with Progress() as progress:
-            task_transcode = progress.add_task(
-                "[cyan]Transcoding...", total=total_files
-            )
-            task_transfer = progress.add_task(
-                "[green]Transferring...", total=total_files
-            )
+        run_jobs(
+            [
+                *resumed,
+                *(
+                    new_job(o_file, plan, copy_strategy)
+                    for o_file, plan in files_to_transcode
+                ),
+            ],
+            server_url,
+            workers,
+            delete_after,
+            journal,
+            threading.Event(),
+        )
 
-            for o_file in files_to_transcode:
-                file = Path(o_file["filepath"])
 
-                # Copy the file to a temporary location
-                temp_file = temp_transcode_path / file.name
-                print(
-                    f"📂 Making temporary copy of [blue]{file}[/blue] at [red]{temp_file}[/red]"
-                )
-                shutil.copy(file, temp_file)
-
-                # Transcode the file
-                transcode_file(temp_file)
-                progress.update(task_transcode, advance=1)
-
-                # Start post-transcoding operations in a separate thread
-                thread = threading.Thread(
-                    target=post_transcode_operations,
-                    args=(
-                        temp_file,
-                        file,
-                        o_file,
-                        server_url,
-                        delete_after,
-                        progress,
-                        task_transfer,
+def run_jobs(jobs, server_url, workers, delete_after, journal, cancel):
+    """Run jobs through the copy, transcode and transfer stages with progress bars"""
+    from rich.progress import Progress
+
+    if not jobs:
+        return
+
+    with Progress() as progress:
+        task_copy = progress.add_task("[blue]Copying...", total=len(jobs))
+        task_transcode = progress.add_task("[cyan]Transcoding...", total=len(jobs))
+        task_transfer = progress.add_task("[green]Transferring...", total=len(jobs))
+
+        run_pipeline(
+            jobs,
+            [
+                (partial(copy_job_input, journal=journal), 1, task_copy),
+                (
+                    partial(encode_job, journal=journal, progress=progress),
+                    workers,
+                    task_transcode,
+                ),
+                (
+                    partial(
+                        post_transcode_operations,
+                        server_url=server_url,
+                        delete_after=delete_after,
+                        journal=journal,
                     ),
-                )
-                thread.start()
-                threads.append(thread)
+                    1,
+                    task_transfer,
+                ),
+            ],
+            progress,
+            cancel,
+        )
 
-            # Wait for all threads to complete
-            for thread in threads:
-                thread.join()
+    uncatalog = [job for job in jobs if job["uncatalog"]]
+    if uncatalog and delete_files(
+        server_url, ids=[job["o_file"]["id"] for job in uncatalog]
+    ):
+        for job in uncatalog:
+            if not job["failed"]:
+                journal.record(job, "catalog_updated")
 
 
-def post_transcode_operations(
-    temp_file, file, o_file, server_url, delete_after, progress, task_transfer
-):
-    """Handle all operations after transcoding in a separate thread"""
-    # Delete the temporary file
-    print(f"🗑️ Deleting [red]{temp_file}[/red]")
-    temp_file.unlink()
+def new_job(o_file, plan, copy_strategy=CopyStrategy.tmp):
+    file = Path(o_file["filepath"])
+    if copy_strategy == CopyStrategy.in_place:
+        temp_file = file
+        temp_transcoded_file = staged_output_path(file)
+    else:
+        # Prefixed with the catalog id, as files in different directories can
+        # share a name and the next job's copy overlaps this job's encode
+        temp_file = temp_transcode_path / f"{o_file['id']}_{file.name}"
+        temp_transcoded_file = temp_file.with_suffix(".jellyfied.mkv")
+    return {
+        "o_file": o_file,
+        "file": file,
+        "copy_strategy": copy_strategy,
+        "temp_file": temp_file,
+        "temp_transcoded_file": temp_transcoded_file,
+        "plan": plan,
+        "state": None,
+        "failed": False,
+        # Set once the job is done with the file's catalog entry
+        "uncatalog": False,
+        # The server's queued job, for jobs claimed by a worker
+        "server_job_id": None,
+    }
+
+
+def run_pipeline(jobs, stages, progress, cancel):
+    """Push jobs through `stages`, a list of (function, workers, task) tuples.
+
+    Each stage runs on its own worker threads and hands jobs to the next one
+    through a bounded queue, so the stages overlap while the number of jobs in
+    flight stays capped. Ctrl-C sets `cancel`; stage functions see it and let
+    the remaining jobs drain through without doing any work.
+    """
+    queues = [queue.Queue(maxsize=1) for _ in stages]
+    stage_threads = []
+    for index, (function, workers, task) in enumerate(stages):
+        outbox = queues[index + 1] if index + 1 < len(stages) else None
+        threads = [
+            threading.Thread(
+                target=run_stage,
+                args=(function, queues[index], outbox, progress, task, cancel),
+                daemon=True,
+            )
+            for _ in range(max(workers, 1))
+        ]
+        for thread in threads:
+            thread.start()
+        stage_threads.append(threads)
+
+    done = threading.Event()
+
+    def feed():
+        try:
+            for job in jobs:
+                if cancel.is_set():
+                    break
+                queues[0].put(job)
+            # Shut the stages down in order once everything upstream has drained
+            for inbox, threads in zip(queues, stage_threads):
+                for _ in threads:
+                    inbox.put(None)
+                for thread in threads:
+                    thread.join()
+        finally:
+            done.set()
+
+    threading.Thread(target=feed, daemon=True).start()
+    # Wait on an event rather than Thread.join, which Ctrl-C can leave in a bad state
+    while not done.is_set():
+        try:
+            done.wait(timeout=0.5)
+        except KeyboardInterrupt:
+            if not cancel.is_set():
+                print("🛑 Cancelling, waiting for running jobs to stop...")
+                cancel.set()
+
+
+def run_stage(function, inbox, outbox, progress, task, cancel):
+    while (job := inbox.get()) is not None:
+        try:
+            function(job, cancel)
+        except Exception as e:
+            print(f"❌ Failed to process [blue]{job['file']}[/blue]: {e}")
+            job["failed"] = True
+        progress.update(task, advance=1)
+        if outbox is not None:
+            outbox.put(job)
+
+
+def copy_job_input(job, cancel, journal):
+    if cancel.is_set() or reached(job, "copied"):
+        return
+
+    journal.record(job, "started")
+    # Leave room for the output, assuming it's no bigger than the source
+    size = job["file"].stat().st_size
+    if job["temp_file"] == job["file"]:
+        check_free_space(job["file"].parent, size)
+    else:
+        job["temp_file"].parent.mkdir(parents=True, exist_ok=True)
+        check_free_space(job["temp_file"].parent, 2 * size)
+        # Copy the file to a temporary location
+        print(
+            f"📂 Making temporary copy of [blue]{job['file']}[/blue] at [red]{job['temp_file']}[/red]"
+        )
+        copy_file(job["file"], job["temp_file"])
+    journal.record(job, "copied")
+
+
+def encode_job(job, cancel, journal, progress=None):
+    if cancel.is_set() or job["failed"] or reached(job, "encoded"):
+        return
+
+    if transcode_file(
+        job["temp_file"],
+        job["temp_transcoded_file"],
+        job["plan"],
+        duration=job["o_file"].get("duration"),
+        progress=progress,
+        cancel=cancel,
+    ):
+        journal.record(job, "encoded")
+    else:
+        job["failed"] = True
+
+
+def post_transcode_operations(job, cancel, server_url, delete_after, journal):
+    """Swap the transcoded file in for the original and update the catalog"""
+    file = job["file"]
+    temp_file = job["temp_file"]
+    temp_transcoded_file = job["temp_transcoded_file"]
+
+    # Delete the temporary copy, unless the original was read in place
+    if temp_file != file and temp_file.exists():
+        print(f"🗑️ Deleting [red]{temp_file}[/red]")
+        temp_file.unlink()
+
+    # Once the original has been moved, finishing is quicker and safer than undoing
+    if cancel.is_set() and not reached(job, "original_moved"):
+        print(f"🛑 Cancelled [blue]{file}[/blue]")
+        rollback_job(job, journal)
+        return
+
+    transcoded_file = file.with_suffix(temp_transcoded_file.suffix)
+    staged_file = staged_output_path(transcoded_file)
+    # After the original is moved, the output lives on as the staged file
+    output_file = (
+        staged_file if reached(job, "original_moved") else temp_transcoded_file
+    )
 
     # Check transcoded file exists and is not empty
-    temp_transcoded_file = temp_file.with_suffix(".jellyfied.mkv")
-    if not temp_transcoded_file.exists() or temp_transcoded_file.stat().st_size == 0:
+    if not reached(job, "output_placed") and (
+        not reached(job, "encoded")
+        or not output_file.exists()
+        or output_file.stat().st_size == 0
+    ):
         print(
             f"❌ Transcoding failed for [blue]{file}[/blue] - output file is empty or missing"
         )
-        if temp_transcoded_file.exists():
-            temp_transcoded_file.unlink()
-        progress.update(task_transfer, advance=1)
-        delete_file(o_file, server_url)
+        job["failed"] = True
+        rollback_job(job, journal)
+        job["uncatalog"] = True
         return
 
-    transcoded_file = file.with_suffix(temp_transcoded_file.suffix)
+    # Stage the output next to its destination, so placing it is a single rename
+    if not reached(job, "original_moved") and temp_transcoded_file != staged_file:
+        check_free_space(file.parent, temp_transcoded_file.stat().st_size)
+        print(
+            f"📂 Copying [red]{temp_transcoded_file}[/red] to [blue]{staged_file}[/blue]"
+        )
+        copy_file(temp_transcoded_file, staged_file)
 
     # Move file to file.old
-    if delete_after:
-        print(f"🗑️ Deleting [blue]{file}[/blue]")
-        file.unlink()
+    if reached(job, "original_moved"):
+        pass
+    elif delete_after:
+        # An original with the output's name is replaced by it atomically below
+        if file != transcoded_file:
+            print(f"🗑️ Deleting [blue]{file}[/blue]")
+            file.unlink()
+        journal.record(job, "original_moved")
     else:
         old_file = file.with_suffix(f"{file.suffix}.old")
         print(f"🔄 Renaming [blue]{file}[/blue] to [blue]{old_file}[/blue]")
         file.rename(old_file)
+        journal.record(job, "original_moved")
 
-    print(
-        f"📂 Copying [red]{temp_transcoded_file}[/red] to [blue]{transcoded_file}[/blue]"
-    )
-    shutil.copy(temp_transcoded_file, transcoded_file)
-    print(f"🗑️ Deleting [red]{temp_transcoded_file}[/red]")
-    temp_transcoded_file.unlink()
+    if not reached(job, "output_placed"):
+        print(
+            f"🔄 Renaming [blue]{staged_file}[/blue] to [blue]{transcoded_file}[/blue]"
+        )
+        os.replace(staged_file, transcoded_file)
+        journal.record(job, "output_placed")
+    if temp_transcoded_file.exists():
+        print(f"🗑️ Deleting [red]{temp_transcoded_file}[/red]")
+        temp_transcoded_file.unlink()
+
+    # The catalog entry is deleted with the rest of the batch once the run ends
+    job["uncatalog"] = True
+
+
+@app.command()
+def enqueue(server_url: str | None = None, count: int = 10, order_by: str = "priority"):
+    """Queue transcode jobs on the server for workers to pick up"""
+    import requests
 
-    # Delete the file from the server
-    delete_file(o_file, server_url)
+    if server_url is None:
+        server_url = get("server_url")
+
+    response = requests.post(
+        f"{server_url}/jobs/enqueue", params={"limit": count, "order_by": order_by}
+    )
+    response.raise_for_status()
+    jobs = response.json()
 
-    # Update transfer progress
-    progress.update(task_transfer, advance=1)
+    print(f"📥 Queued {len(jobs)} jobs")
+    for job in jobs:
+        print(file_to_string(job["file"]))
 
 
 @app.command()
-def delete(id: str, server_url: str | None = None):
+def worker(
+    server_url: str | None = None,
+    name: str | None = None,
+    lease: int = 600,
+    poll_interval: int = 30,
+    once: bool = False,
+    delete_after: bool = False,
+    copy_strategy: CopyStrategy = CopyStrategy.tmp,
+):
+    """Claim jobs from the server's queue and transcode them until stopped"""
+    import requests
+
     if server_url is None:
         server_url = get("server_url")
+    if name is None:
+        name = socket.gethostname()
+
+    cancel = threading.Event()
+    with Journal() as journal:
+        # Finish whatever a previous run of this worker was doing when it died
+        recovered = recover_jobs(journal, resume=True)
+        run_jobs(recovered, server_url, 1, delete_after, journal, cancel)
+        for job in recovered:
+            if job["server_job_id"] is not None and not cancel.is_set():
+                report = {"worker": name}
+                if job["failed"]:
+                    report["error"] = f"Transcoding failed on {name}"
+                report_job(
+                    f"{server_url}/jobs/{job['server_job_id']}",
+                    "fail" if job["failed"] else "complete",
+                    report,
+                    poll_interval,
+                )
+        print(f"👷 Worker [blue]{name}[/blue] waiting for jobs from {server_url}")
+
+        codecs = None
+        while not cancel.is_set():
+            try:
+                if codecs is None:
+                    codecs = get_compatible_codecs(server_url)
+                response = requests.post(
+                    f"{server_url}/jobs/claim",
+                    json={"worker": name, "lease_seconds": lease},
+                )
+                response.raise_for_status()
+                claimed = response.json()
+            except requests.RequestException as e:
+                print(f"⚠️ Failed to claim a job, retrying in {poll_interval}s: {e}")
+                try:
+                    cancel.wait(timeout=poll_interval)
+                except KeyboardInterrupt:
+                    cancel.set()
+                continue
+
+            if claimed is not None:
+                run_leased_job(
+                    claimed,
+                    codecs,
+                    name,
+                    lease,
+                    server_url,
+                    delete_after,
+                    copy_strategy,
+                    journal,
+                    cancel,
+                    poll_interval,
+                )
+            elif not once:
+                try:
+                    cancel.wait(timeout=poll_interval)
+                except KeyboardInterrupt:
+                    cancel.set()
+                continue
+            else:
+                print("💤 No jobs queued")
+
+            if once:
+                return
+
+    print(f"🛑 Worker [blue]{name}[/blue] stopped")
+
+
+def run_leased_job(
+    claimed,
+    codecs,
+    name,
+    lease,
+    server_url,
+    delete_after,
+    copy_strategy,
+    journal,
+    cancel,
+    poll_interval,
+):
+    """Transcode a claimed job while keeping its lease alive, then report back"""
+    job_url = f"{server_url}/jobs/{claimed['id']}"
+    report = {"worker": name}
 
-    if id == "all":
-        if typer.confirm(
-            "Are you sure you want to delete all files from the http server?"
-        ):
-            files = get_files(server_url)
-            for file in files:
-                delete_file(file, server_url)
+    if claimed["file"] is None:
+        report["error"] = "File is no longer in the catalog"
+        report_job(job_url, "fail", report, poll_interval)
         return
 
-    response = requests.delete(f"{server_url}/files/{id}")
-    if response.status_code == 200:
-        print(f"🗑️ Successfully deleted file with ID {id}")
+    print(f"🎫 Claimed job {claimed['id']}: {file_to_string(claimed['file'])}")
+    plan = plan_transcode(claimed["file"], codecs)
+    print(f"   ↳ {plan_to_string(plan)}")
+
+    job = new_job(claimed["file"], plan, copy_strategy)
+    job["server_job_id"] = claimed["id"]
+    finished = threading.Event()
+    heartbeat = threading.Thread(
+        target=keep_lease, args=(job_url, name, lease, finished), daemon=True
+    )
+    heartbeat.start()
+
+    try:
+        run_jobs([job], server_url, 1, delete_after, journal, cancel)
+    finally:
+        finished.set()
+
+    if cancel.is_set():
+        # Hand the job back so another worker can pick it up straight away
+        outcome = "release"
+    elif job["failed"]:
+        outcome = "fail"
+        report["error"] = f"Transcoding failed on {name}"
     else:
+        outcome = "complete"
+
+    report_job(job_url, outcome, report, poll_interval)
+
+
+def report_job(job_url, outcome, report, poll_interval):
+    """POST the job's outcome, retrying server and network errors.
+
+    A lost report would have the job leased again and the file transcoded
+    twice, so completions and failures are retried until the server answers.
+    A release is not worth waiting for, as the lease runs out anyway.
+    """
+    import requests
+
+    while True:
+        try:
+            response = requests.post(f"{job_url}/{outcome}", json=report)
+        except requests.RequestException as e:
+            error = e
+        else:
+            if response.status_code == 409:
+                print(f"⚠️ Lease on {job_url} was lost, result not recorded")
+                return
+            if response.ok:
+                job = response.json()
+                print(f"📤 Job {job['id']}: {job['status']}")
+                return
+            if response.status_code < 500:
+                print(
+                    f"❌ Failed to report {outcome} for {job_url}. Status code: {response.status_code}, Response: {response.text}"
+                )
+                return
+            error = f"status code {response.status_code}"
+
+        if outcome == "release":
+            print(f"⚠️ Failed to release {job_url}: {error}")
+            return
         print(
-            f"❌ Failed to delete file with ID {id}. Status code: {response.status_code}, Response: {response.text}"
+            f"⚠️ Failed to report {outcome} for {job_url}, retrying in {poll_interval}s: {error}"
         )
+        time.sleep(poll_interval)
+
+
+def keep_lease(job_url, name, lease, finished):
+    """Renew the job's lease every third of its duration until `finished` is set"""
+    import requests
+
+    while not finished.wait(timeout=lease / 3):
+        try:
+            response = requests.post(
+                f"{job_url}/heartbeat", json={"worker": name, "lease_seconds": lease}
+            )
+        except requests.RequestException as e:
+            print(f"⚠️ Failed to renew lease: {e}")
+            continue
+        if response.status_code == 409:
+            print("⚠️ Lease expired or was taken over by another worker")
+            return
 
 
 @app.command()
-def rollback(path: Path, dry_run: bool = True):
-    """Find all empty .mkv files and restore their .old versions if available"""
-    file_count = 0
-    empty_files_found = 0
-    restored_count = 0
+def delete(
+    ids: list[str] | None = typer.Argument(None),
+    path_prefix: str | None = None,
+    video_codec: str | None = None,
+    missing_on_disk: bool = False,
+    server_url: str | None = None,
+):
+    """Delete files from the catalog by id, or "all", or by filter.
 
-    for root, _, files in os.walk(path):
-        for file in files:
-            file_count += 1
-            file_path = Path(root) / file
+    `--missing-on-disk` checks paths on this machine, where the library is
+    mounted, and deletes the matching files that are gone.
+    """
+    if server_url is None:
+        server_url = get("server_url")
+
+    if ids == ["all"]:
+        if typer.confirm(
+            "Are you sure you want to delete all files from the http server?"
+        ):
+            delete_files(server_url, all=True)
+        return
 
-            # Check for empty .mkv files
-            if file_path.suffix.lower() == ".mkv" and file_path.stat().st_size == 0:
-                empty_files_found += 1
-                old_file = file_path.with_suffix(file_path.suffix + ".old")
+    file_filter = {
+        "ids": [int(id) for id in ids or []],
+        "path_prefix": path_prefix,
+        "video_codec": video_codec,
+    }
+    if not any(file_filter.values()) and not missing_on_disk:
+        print('❌ Give file ids, "all", or a filter option')
+        raise typer.Exit(1)
+
+    if missing_on_disk:
+        with synced_snapshot(server_url) as snapshot:
+            missing_ids = [
+                file["id"]
+                for file in snapshot.files()
+                if (not file_filter["ids"] or file["id"] in file_filter["ids"])
+                and (not path_prefix or file["filepath"].startswith(path_prefix))
+                and (video_codec is None or file["video_codec"] == video_codec)
+                and not os.path.exists(file["filepath"])
+            ]
+        if not missing_ids:
+            print("✅ No catalogued files are missing on disk")
+            return
+        file_filter["ids"] = missing_ids
+    delete_files(server_url, **file_filter)
 
-                if old_file.exists():
-                    print(
-                        f"Found empty file: [blue]{file_path}[/blue] ({file_path.stat().st_size} bytes)"
-                    )
-                    print(
-                        f"🗑️ {'Would delete' if dry_run else 'Deleting'} empty file [blue]{file_path}[/blue]"
-                    )
-                    print(
-                        f"🔄 {'Would restore' if dry_run else 'Restoring'} [blue]{old_file}[/blue] to [blue]{file_path}[/blue]"
-                    )
 
-                    if not dry_run:
-                        file_path.unlink()  # Delete empty file
-                        old_file.rename(file_path)  # Restore .old file
-                        restored_count += 1
-                else:
-                    print(
-                        f"⚠️ Found empty file but no .old version: [blue]{file_path}[/blue]"
-                    )
+@app.command()
+def rollback(path: Path | None = typer.Argument(None), dry_run: bool = True):
+    """Roll back transcodes that were interrupted, as recorded in the journal"""
+    with Journal() as journal:
+        jobs = [
+            job
+            for job in journal.incomplete()
+            if path is None or job["file"].is_relative_to(path.resolve())
+        ]
+        if not jobs:
+            print("✅ No interrupted transcodes to roll back")
+            return
+
+        for job in jobs:
+            print(
+                f"🔄 {'Would roll back' if dry_run else 'Rolling back'} [blue]{job['file']}[/blue] (interrupted after step {job['state']})"
+            )
+            if not dry_run:
+                rollback_job(job, journal)
 
-    print("\n📊 Summary:")
-    print(f"Scanned: {file_count} files")
-    print(f"Found: {empty_files_found} empty files")
-    print(f"Restored: {restored_count} files")
     if dry_run:
         print(
             "\nThis was a dry run. Use --no-dry-run to actually perform the operations."
@@ -2,9 +2,9 @@ import axios from "axios";
 
 const API_URL = "http://192.168.1.144:8000/files";
 
-export const getFiles = async (skip = 0, limit = 10) => {
+export const getFiles = async (afterId?: number, limit = 10) => {
   const response = await axios.get(API_URL, {
-    params: { skip, limit },
+    params: { after_id: afterId, limit, fast: true },
   });
   return response.data;
 };
@@ -19,10 +19,9 @@ export const deleteFile = async (id: number) => {
 };
 
 export const deleteFiles = async (ids: number[]) => {
-  await Promise.all(ids.map((id) => deleteFile(id)));
+  await axios.delete(`${API_URL}/`, { data: { ids } });
 };
 
 export const deleteAllFiles = async () => {
-  const files = await getFiles();
-  await deleteFiles(files.map((file: any) => file.id));
+  await axios.delete(`${API_URL}/`, { data: { all: true } });
 };
@@ -10,15 +10,15 @@ const FileList: React.FC = () => {
 
   useEffect(() => {
     const fetchAllFiles = async () => {
-      let allFiles: any[] = [];
-      let skip = 0;
+      const allFiles: any[] = [];
+      let afterId: number | undefined;
       const limit = 500;
       let fetchedFiles: any[];
 
       do {
-        fetchedFiles = await getFiles(skip, limit);
-        allFiles = [...allFiles, ...fetchedFiles];
-        skip += limit;
+        fetchedFiles = await getFiles(afterId, limit);
+        allFiles.push(...fetchedFiles);
+        afterId = fetchedFiles[fetchedFiles.length - 1]?.id;
       } while (fetchedFiles.length === limit);
 
       setFiles(allFiles);
@@ -1,107 +1,211 @@
+import argparse
+import hashlib
 import json
 import os
 import subprocess
-import sys
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import requests
 
+media_extensions = {".mp4", ".mkv", ".avi", ".mov", ".flv", ".wmv"}
 
-def get_file_info(file_path):
-    try:
-        file_info = {
-            "filepath": str(file_path),
-            "filename": file_path.name,
-            "file_extension": file_path.suffix,
-            "file_size": file_path.stat().st_size,
-            "video_codec": None,
-            "video_resolution": None,
-            "audio_channels": [],
-            "subtitle_channels": [],
+
+# Blocks hashed at the start, middle and end of a file for its fingerprint
+FINGERPRINT_BLOCK_SIZE = 1024 * 1024
+
+
+def fingerprint_file(file_path):
+    """Size plus a BLAKE2b hash of the first, middle and last MiB of the file"""
+    size = os.path.getsize(file_path)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb", buffering=0) as file:
+        offsets = {
+            0,
+            max(size // 2 - FINGERPRINT_BLOCK_SIZE // 2, 0),
+            max(size - FINGERPRINT_BLOCK_SIZE, 0),
         }
+        for offset in sorted(offsets):
+            digest.update(os.pread(file.fileno(), FINGERPRINT_BLOCK_SIZE, offset))
+    return f"{size}:{digest.hexdigest()}"
 
-        # Run ffprobe to get detailed information about the file
-        result = subprocess.run(
-            [
-                "ffprobe",
-                "-v",
-                "error",
-                "-print_format",
-                "json",
-                "-show_streams",
-                str(file_path),
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-        ffprobe_output = json.loads(result.stdout)
-
-        for stream in ffprobe_output.get("streams", []):
-            if stream["codec_type"] == "video":
-                file_info["video_codec"] = stream.get("codec_name")
-                file_info["video_resolution"] = (
-                    f"{stream.get('width')}x{stream.get('height')}"
-                )
-            elif stream["codec_type"] == "audio":
-                audio_channel = {
-                    "name": stream.get("tags", {}).get("title", "unknown"),
-                    "channel": stream.get("tags", {}).get("language", "unknown"),
-                    "codec": stream.get("codec_name"),
-                }
-                file_info["audio_channels"].append(audio_channel)
-            elif stream["codec_type"] == "subtitle":
-                subtitle_channel = {
-                    "name": stream.get("tags", {}).get("title", "unknown"),
-                    "subtitle": stream.get("tags", {}).get("language", "unknown"),
-                    "codec": stream.get("codec_name"),
-                }
-                file_info["subtitle_channels"].append(subtitle_channel)
-
-    except FileNotFoundError:
+
+def probe_file(file_path, timeout=None):
+    stat = file_path.stat()
+    file_info = {
+        "filepath": str(file_path),
+        "filename": file_path.name,
+        "file_extension": file_path.suffix,
+        "file_size": stat.st_size,
+        "file_mtime_ns": stat.st_mtime_ns,
+        "video_codec": None,
+        "video_resolution": None,
+        "duration": None,
+        "bit_rate": None,
+        "fingerprint": fingerprint_file(file_path),
+        "audio_channels": [],
+        "subtitle_channels": [],
+    }
+
+    # Run ffprobe to get detailed information about the file
+    result = subprocess.run(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-print_format",
+            "json",
+            "-show_streams",
+            "-show_format",
+            str(file_path),
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        timeout=timeout,
+    )
+    ffprobe_output = json.loads(result.stdout)
+
+    # Duration and bit rate feed the server's transcode priority estimate
+    file_format = ffprobe_output.get("format", {})
+    if "duration" in file_format:
+        file_info["duration"] = float(file_format["duration"])
+    if "bit_rate" in file_format:
+        file_info["bit_rate"] = int(file_format["bit_rate"])
+
+    for stream in ffprobe_output.get("streams", []):
+        if stream["codec_type"] == "video":
+            file_info["video_codec"] = stream.get("codec_name")
+            file_info["video_resolution"] = (
+                f"{stream.get('width')}x{stream.get('height')}"
+            )
+        elif stream["codec_type"] == "audio":
+            audio_channel = {
+                "name": stream.get("tags", {}).get("title", "unknown"),
+                "channel": stream.get("tags", {}).get("language", "unknown"),
+                "codec": stream.get("codec_name") or "unknown",
+            }
+            file_info["audio_channels"].append(audio_channel)
+        elif stream["codec_type"] == "subtitle":
+            subtitle_channel = {
+                "name": stream.get("tags", {}).get("title", "unknown"),
+                "subtitle": stream.get("tags", {}).get("language", "unknown"),
+                "codec": stream.get("codec_name") or "unknown",
+            }
+            file_info["subtitle_channels"].append(subtitle_channel)
+
+    return file_info
+
+
+def report_probe_error(file_path, error):
+    if isinstance(error, FileNotFoundError) and error.filename == "ffprobe":
         print(
             "ffprobe not found. Please ensure ffmpeg is installed and ffprobe is in your PATH."
         )
-        return None
-    except Exception as e:
-        print(f"Error processing file {file_path}: {e}")
-        return None
+    elif isinstance(error, OSError):
+        print(f"Can't read file {file_path}: {error.strerror}")
+    elif isinstance(error, subprocess.TimeoutExpired):
+        print(f"Timed out probing file {file_path} after {error.timeout}s")
+    else:
+        print(f"Error processing file {file_path}: {error}")
 
-    return file_info
 
+def is_media_file(file_path):
+    """Media files, except hidden ones such as transcode output being staged"""
+    return (
+        file_path.suffix.lower() in media_extensions
+        and not file_path.name.startswith(".")
+        and not file_path.name.endswith(".jellyfied.mkv")
+    )
 
-def scan_directory(directory, server_url, dry_run):
-    media_extensions = {".mp4", ".mkv", ".avi", ".mov", ".flv", ".wmv"}
+
+def iter_media_files(directory):
     for root, _, files in os.walk(directory):
         for file in files:
             file_path = Path(root) / file
-            if file_path.suffix.lower() in media_extensions:
-                file_info = get_file_info(file_path)
-                if file_info is None:
-                    continue
-                if dry_run:
-                    print(json.dumps(file_info, indent=4))
-                else:
-                    send_file_info_to_server(file_info, server_url)
-
-
-def send_file_info_to_server(file_info, server_url):
-    response = requests.post(f"{server_url}/files/", json=file_info)
+            if is_media_file(file_path):
+                yield file_path
+
+
+def probe_files(file_paths, jobs=1, timeout=None):
+    """Probe files on a bounded thread pool, yielding (path, info, error) in input order"""
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        pending = deque()
+        for file_path in file_paths:
+            pending.append((file_path, executor.submit(probe_file, file_path, timeout)))
+            # Keep the walk streaming without queueing the whole tree
+            if len(pending) >= 2 * max(jobs, 1):
+                yield collect_probe(*pending.popleft())
+
+        while pending:
+            yield collect_probe(*pending.popleft())
+
+
+def collect_probe(file_path, future):
+    try:
+        return file_path, future.result(), None
+    except Exception as e:
+        return file_path, None, e
+
+
+def scan_directory(
+    directory, server_url, dry_run, jobs=1, probe_timeout=None, batch_size=200
+):
+    with requests.Session() as http:
+        batch = []
+        for file_path, file_info, error in probe_files(
+            iter_media_files(directory), jobs=jobs, timeout=probe_timeout
+        ):
+            if error is not None:
+                report_probe_error(file_path, error)
+                continue
+            if dry_run:
+                print(json.dumps(file_info, indent=4))
+                continue
+            batch.append(file_info)
+            if len(batch) >= batch_size:
+                send_files_info_to_server(http, batch, server_url)
+                batch = []
+
+        if batch:
+            send_files_info_to_server(http, batch, server_url)
+
+
+def send_files_info_to_server(http, files_info, server_url):
+    response = http.post(f"{server_url}/files/bulk", json=files_info)
     if response.status_code == 200:
-        print(f"Successfully uploaded: {file_info['filename']}")
+        results = response.json()
+        statuses = Counter(result["status"] for result in results)
+        print(
+            f"Successfully uploaded {len(files_info) - statuses['invalid']} files "
+            f"({statuses['inserted']} inserted, {statuses['updated']} updated, {statuses['moved']} moved, {statuses['unchanged']} unchanged)"
+        )
+        for file_info, result in zip(files_info, results):
+            if result["status"] == "invalid":
+                print(f"Rejected {file_info['filepath']}: {result['error']}")
     else:
+        filenames = ", ".join(file_info["filename"] for file_info in files_info)
         print(
-            f"Failed to upload: {file_info['filename']}. Status code: {response.status_code}, Response: {response.text}"
+            f"Failed to upload: {filenames}. Status code: {response.status_code}, Response: {response.text}"
         )
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3 or len(sys.argv) > 4:
-        print("Usage: python main.py <folder> <fastapi_server_url> [--dry-run]")
-        sys.exit(1)
-
-    folder = sys.argv[1]
-    fastapi_server_url = sys.argv[2]
-    dry_run = "--dry-run" in sys.argv
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folder")
+    parser.add_argument("fastapi_server_url")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--probe-timeout", type=float, default=60)
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
 
-    scan_directory(folder, fastapi_server_url, dry_run)
+    scan_directory(
+        args.folder,
+        args.fastapi_server_url,
+        args.dry_run,
+        jobs=args.jobs,
+        probe_timeout=args.probe_timeout,
+        batch_size=args.batch_size,
+    )